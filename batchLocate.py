@@ -0,0 +1,172 @@
+############################################################################################################
+# Name: batchLocate.py
+#
+# Description: Locate every cell tower in a set of formatted coordinate files (the "[CDMA]-[instance].txt"
+#   files written by formatCoords.py) in parallel, with one worker process per core. Each file is localized
+#   with the estimator of cell.py (--estimator circle) or cell2.py (--estimator triangles), and the results
+#   are written as one tab-delimited table with the columns
+#       cdma, instance, lat, lon, radius, points, seconds
+#   where points is the number of unique points in the file and seconds is the time spent on the file.
+#   The radius is in degrees, or in meters with --metric. With --thin, points is the number of points left
+#   after thinning.
+#   Files that could not be localized have empty lat, lon and radius.
+#
+#   Inputs may be directories (all "[CDMA]-[instance].txt" files in the directory are used), file names
+#   or glob patterns (quote them so that the shell does not expand them).
+#
+############################################################################################################
+
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from cdmaExtract import FILE_PATTERN
+from coordIO import loadCachedCoords, clearCache, describeThinning
+from commonOptions import addThinOption
+from localize import CIRCLE_METHODS, TRIANGLE_SEARCHES, DEFAULT_MAX_RADIUS, DEFAULT_MAX_RADIUS_METERS, \
+    prepareCoords, circleEstimate, triangleEstimate
+
+# IN THE COMMAND LINE, RUN THIS SCRIPT WITH THE OPTION -h TO PRINT HELP MESSAGE. EXAMPLE:
+# >> python batchLocate.py -h
+
+COLUMNS = ["cdma", "instance", "lat", "lon", "radius", "points", "seconds"]
+
+# Function findFiles(...) expands a list of directories, file names and glob patterns into a sorted list
+# of coordinate file names without duplicates.
+def findFiles(inputs):
+    fileNames = set()
+    for inputPath in inputs:
+        if os.path.isdir(inputPath):
+            for entry in os.listdir(inputPath):
+                if FILE_PATTERN.match(entry):
+                    fileNames.add(os.path.join(inputPath, entry))
+        else:
+            fileNames.update(glob.glob(inputPath))
+    return sorted(fileNames)
+
+# Function addEstimatorOptions(...) adds the options of the estimators (and their defaults) to a command line
+# argument parser. locateRow(...) takes the resulting dict of options.
+def addEstimatorOptions(parser):
+    parser.add_argument("-e", "--estimator", choices=["circle", "triangles"], default="triangles",
+        help="'circle' uses the estimator of cell.py, 'triangles' the method of triangles/perimeters of" +
+            " cell2.py. Default triangles")
+    parser.add_argument("-m", "--method", choices=CIRCLE_METHODS, default="search",
+        help="Estimation method of cell.py, with --estimator circle. Default search")
+    parser.add_argument("-p", "--percent", type=float, default=0.9,
+        help="Percentage of points (as a decimal) used by cell.py, with --estimator circle. Default 0.9")
+    parser.add_argument("-s", "--search", choices=TRIANGLE_SEARCHES, default="hull",
+        help="Triangle search mode of cell2.py, with --estimator triangles. Default hull")
+    parser.add_argument("-t", "--num-triangles", type=int, default=10,
+        help="Number of largest triangles averaged, with --estimator triangles. Default 10")
+    parser.add_argument("-b", "--time-budget", type=float, default=None,
+        help="Instead of searching all sets of 3 points, sample random sets for this many seconds per file and" +
+            " use the largest triangles found, with --estimator triangles.")
+    parser.add_argument("-r", "--max-radius", type=float, default=None,
+        help="Largest circle radius included in the average, with --estimator triangles. Default 0.25 (degrees)," +
+            " or {:.0f} with --metric".format(DEFAULT_MAX_RADIUS_METERS))
+    parser.add_argument("-M", "--metric", action="store_true",
+        help="Project the points onto a local plane in meters before localizing. Radii (including --max-radius)" +
+            " are then in meters.")
+    addThinOption(parser)
+
+# Function locateRow(...) runs the chosen estimator on an M x 2 array of unique coordinates and fills in the
+# lat, lon, radius, points and unthinned entries of the results row. options is a dict of the command line
+# options.
+def locateRow(coordArray, options, row):
+    row["unthinned"] = len(coordArray)
+    coordArray, workArray, origin = prepareCoords(coordArray, options["metric"], options["thin"])
+    row["points"] = len(coordArray)
+    if options["estimator"] == "circle":
+        estimate = circleEstimate(workArray, origin, options["percent"], options["method"])
+        located = estimate["circle"] is not None
+    else:
+        maxRadius = options["max_radius"]
+        if maxRadius is None:
+            maxRadius = DEFAULT_MAX_RADIUS_METERS if options["metric"] else DEFAULT_MAX_RADIUS
+        estimate = triangleEstimate(workArray, origin, options["num_triangles"], options["search"], maxRadius,
+            timeBudget=options["time_budget"])
+        located = estimate["triUsed"].any()
+    if located:
+        row["lat"], row["lon"], row["radius"] = estimate["lat"], estimate["lon"], estimate["radius"]
+    return row
+
+# Function locateFile(...) loads one coordinate file, runs the chosen estimator on it and returns a dict
+# with the COLUMNS of its results row. options is a dict of the command line options. Runs in a worker
+# process, so errors are caught and reported in the row rather than raised.
+def locateFile(fileName, options):
+    startTime = time.time()
+    nameMatch = FILE_PATTERN.match(os.path.basename(fileName))
+    row = {"cdma": nameMatch.group(1) if nameMatch else "",
+        "instance": nameMatch.group(2) if nameMatch else "",
+        "lat": None, "lon": None, "radius": None, "points": 0, "unthinned": 0, "error": None}
+
+    try:
+        if options["clear_cache"]:
+            clearCache(fileName)
+        coordArray = loadCachedCoords(fileName, not options["no_cache"])
+        locateRow(coordArray, options, row)
+    except Exception as error:
+        row["error"] = "{:s}: {:s}".format(type(error).__name__, str(error))
+
+    row["seconds"] = time.time() - startTime
+    return row
+
+# Function formatRow(...) formats a results row as a tab-delimited line.
+def formatRow(row):
+    values = [row["cdma"], row["instance"]]
+    for key in ["lat", "lon", "radius"]:
+        values.append("" if row[key] is None else "{:f}".format(row[key]))
+    values.append("{:d}".format(row["points"]))
+    values.append("{:.3f}".format(row["seconds"]))
+    return "\t".join(values)
+
+# Function locateFiles(...) localizes the given files in a pool of `workers` processes (all cores if None)
+# and returns the results rows in the order of fileNames.
+def locateFiles(fileNames, options, workers=None):
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(locateFile, fileNames, [options] * len(fileNames)))
+
+# Function main(...) runs the script with the given command line arguments (sys.argv if None).
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("inputs", nargs="+",
+        help="Directories, coordinate files or glob patterns of coordinate files to localize")
+    addEstimatorOptions(parser)
+    parser.add_argument("-j", "--workers", type=int, default=None,
+        help="Number of worker processes. Default: the number of cores")
+    parser.add_argument("--no-cache", action="store_true",
+        help="Do not read or write the caches of parsed coordinates kept next to the input files.")
+    parser.add_argument("--clear-cache", action="store_true",
+        help="Delete the caches of parsed coordinates of the input files before running (they are then rebuilt).")
+    parser.add_argument("-O", "--output", help="File to write the results table to. Default: standard output")
+    args = vars(parser.parse_args(argv))
+
+    fileNames = findFiles(args["inputs"])
+    if len(fileNames) == 0:
+        print("Error: no coordinate files found. Exiting.")
+        return
+
+    startTime = time.time()
+    rows = locateFiles(fileNames, args, args["workers"])
+
+    output = open(args["output"], "w") if args["output"] else sys.stdout
+    output.write("\t".join(COLUMNS) + "\n")
+    for row in rows:
+        output.write(formatRow(row) + "\n")
+    if output is not sys.stdout:
+        output.close()
+
+    for fileName, row in zip(fileNames, rows):
+        if row["error"] is not None:
+            sys.stderr.write("Error in {:s}: {:s}\n".format(fileName, row["error"]))
+    if args["thin"] is not None:
+        numUnthinned = sum(row["unthinned"] for row in rows)
+        numPoints = sum(row["points"] for row in rows)
+        sys.stderr.write(describeThinning(numPoints, numUnthinned) + "\n")
+    sys.stderr.write("{:d} files localized in {:.3f} seconds.\n".format(len(rows), time.time() - startTime))
+
+if __name__ == "__main__":
+    main()
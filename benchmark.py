@@ -0,0 +1,236 @@
+############################################################################################################
+# Name: benchmark.py
+#
+# Description: Measure the speed and accuracy of the localization pipeline on synthetic data. For each size
+#   in a sweep, a Tasker-format log is generated with hand-off points on a noisy ring around each of a
+#   number of known towers (with configurable duplicate and outlier rates). The log is then run through
+#   each stage of the pipeline and the time of each stage is reported:
+#       extract     formatCoords.py -X on the log (run as a subprocess, so it includes interpreter startup)
+#       parse       loadCoords() on each extracted file
+#       dedup       uniqueCoords() on each file's points
+#       project     toLocal() on each file's points (with --metric only)
+#       thin        thinCoords() on each file's points (with --thin only)
+#       search      the largest-perimeter triangle search of cell2.py
+#       solve       the circumcircles of the triangles and their average
+#       <method>    each of the cell.py estimators given with --methods
+#   Throughput is reported in points per second (rows per second for extract). The location error of each
+#   estimator is the distance in meters between the estimated and true tower, as median and maximum over
+#   the towers.
+#
+############################################################################################################
+
+import argparse
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+from coordIO import loadCoords, uniqueCoords, thinCoords
+from commonOptions import addThinOption
+from localize import CIRCLE_METHODS, TRIANGLE_SEARCHES, DEFAULT_MAX_RADIUS, DEFAULT_MAX_RADIUS_METERS, \
+    locateCircle, averageCircles
+from projection import toLocal, fromLocal, circleFromLocal
+from circleFit import circumcircles
+from triangleSearch import largestTriangles, hullTriangles
+
+# IN THE COMMAND LINE, RUN THIS SCRIPT WITH THE OPTION -h TO PRINT HELP MESSAGE. EXAMPLE:
+# >> python benchmark.py --sizes 100 300 1000 --cdmas 5
+
+# Approximate length of one degree of latitude, in meters.
+METERS_PER_DEGREE = 111320.
+
+# Function generateLog(...) writes a synthetic Tasker log to fileName, in the default column layout of
+# formatCoords.py (CDMA in column 2 as "CDMA:000", latitude in column 3, longitude in column 4), and returns
+# a dict mapping each CDMA to the (lat, lon) of its tower.
+#   numPoints       number of distinct hand-off points per tower
+#   numCdmas        number of towers
+#   duplicateRate   fraction of extra rows that repeat an earlier point of the same tower
+#   outlierRate     fraction of points replaced by points scattered uniformly around the tower
+#   radius          radius of the ring of hand-off points, in degrees
+#   noise           standard deviation of the radial noise, as a fraction of radius
+def generateLog(fileName, numPoints, numCdmas, duplicateRate=0.2, outlierRate=0.02, radius=0.02, noise=0.05,
+        seed=0):
+    rng = np.random.RandomState(seed)
+    towers = dict()
+    rows = list()
+    for tower in range(numCdmas):
+        cdma = 100 + tower
+        towerLat = 40. + rng.uniform(-1., 1.)
+        towerLon = -75. + rng.uniform(-1., 1.)
+        towers[cdma] = (towerLat, towerLon)
+
+        theta = rng.uniform(0., 2. * math.pi, numPoints)
+        r = radius * (1. + noise * rng.randn(numPoints))
+        lats = towerLat + r * np.cos(theta)
+        lons = towerLon + r * np.sin(theta) / math.cos(math.radians(towerLat))
+
+        isOutlier = rng.uniform(size=numPoints) < outlierRate
+        lats[isOutlier] = towerLat + rng.uniform(-3. * radius, 3. * radius, np.count_nonzero(isOutlier))
+        lons[isOutlier] = towerLon + rng.uniform(-3. * radius, 3. * radius, np.count_nonzero(isOutlier))
+
+        order = np.arange(numPoints)
+        duplicates = rng.randint(0, numPoints, int(duplicateRate * numPoints))
+        order = np.concatenate((order, duplicates))
+        for index in order:
+            rows.append((cdma, lats[index], lons[index]))
+
+    rowOrder = rng.permutation(len(rows))
+    with open(fileName, "w") as logFile:
+        for rowNumber, index in enumerate(rowOrder):
+            cdma, lat, lon = rows[index]
+            logFile.write("{:d}\tcell\tCDMA:{:d}\t{:.6f}\t{:.6f}\n".format(rowNumber, cdma, lat, lon))
+    return towers
+
+# Function locationError(...) returns the distance in meters between two (lat, lon) points, using the local
+# equirectangular approximation (accurate for the short distances involved).
+def locationError(estimate, truth):
+    dLat = estimate[0] - truth[0]
+    dLon = (estimate[1] - truth[1]) * math.cos(math.radians(truth[0]))
+    return METERS_PER_DEGREE * math.hypot(dLat, dLon)
+
+# Class StageTimer accumulates the time spent in each named stage, and the number of items processed.
+class StageTimer:
+    def __init__(self):
+        self.seconds = dict()
+        self.items = dict()
+
+    def add(self, stage, seconds, items):
+        self.seconds[stage] = self.seconds.get(stage, 0.) + seconds
+        self.items[stage] = self.items.get(stage, 0) + items
+
+# Function timeCall(...) calls function(*args), adds its time to the given stage of timer, and returns its result.
+def timeCall(timer, stage, items, function, *args):
+    startTime = time.time()
+    result = function(*args)
+    timer.add(stage, time.time() - startTime, items)
+    return result
+
+# Function runSize(...) generates a log for one size in the sweep, runs it through the pipeline, and returns
+# (timer, errors), where errors maps each estimator to its list of location errors in meters.
+def runSize(numPoints, options, workDir):
+    logName = os.path.join(workDir, "tasker.txt")
+    towers = generateLog(logName, numPoints, options["cdmas"], options["duplicates"], options["outliers"],
+        options["radius"], options["noise"], options["seed"])
+    timer = StageTimer()
+    errors = dict()
+
+    # Extract the coordinates of each tower into its own file with formatCoords.py.
+    extractDir = os.path.join(workDir, "extract-{:d}".format(numPoints))
+    os.mkdir(extractDir)
+    formatCoords = os.path.join(os.path.dirname(os.path.abspath(__file__)), "formatCoords.py")
+    with open(logName) as logFile:
+        numRows = sum(1 for line in logFile)
+    startTime = time.time()
+    subprocess.check_call([sys.executable, formatCoords, logName, "-X"], cwd=extractDir,
+        stdout=open(os.devnull, "w"))
+    timer.add("extract", time.time() - startTime, numRows)
+
+    for cdma, truth in towers.items():
+        fileName = os.path.join(extractDir, "{:d}-1.txt".format(cdma))
+        coordArray = timeCall(timer, "parse", numRows // len(towers), loadCoords, fileName)
+        coordArray = timeCall(timer, "dedup", len(coordArray), uniqueCoords, coordArray)
+        if options["metric"]:
+            workArray, origin = timeCall(timer, "project", len(coordArray), toLocal, coordArray)
+            maxRadius = DEFAULT_MAX_RADIUS_METERS
+        else:
+            workArray = coordArray
+            maxRadius = DEFAULT_MAX_RADIUS
+        if options["thin"] is not None:
+            numUnthinned = len(coordArray)
+            coordArray, workArray = timeCall(timer, "thin", numUnthinned, thinCoords, coordArray, workArray,
+                options["thin"])
+            timer.add("thinned", 0., numUnthinned - len(coordArray))
+
+        if options["search"] == "hull":
+            search = hullTriangles
+        else:
+            search = largestTriangles
+        triPerims, triIndices = timeCall(timer, "search", len(coordArray), search, workArray,
+            options["triangles"])
+
+        startTime = time.time()
+        triPoints = workArray[triIndices]
+        h, k, r, triCollinear = circumcircles(triPoints[:,0,:], triPoints[:,1,:], triPoints[:,2,:])
+        avgLat, avgLon, avgRad, used = averageCircles(np.column_stack((h, k, r)), triCollinear, maxRadius)
+        if options["metric"]:
+            avgLat, avgLon = fromLocal([[avgLat, avgLon]], origin)[0]
+        timer.add("solve", time.time() - startTime, len(coordArray))
+        if used.any():
+            errors.setdefault("triangles", list()).append(locationError((avgLat, avgLon), truth))
+
+        for method in options["methods"]:
+            circle = timeCall(timer, method, len(coordArray), locateCircle, workArray, options["percent"], method)
+            if options["metric"]:
+                circle = circleFromLocal(circle, origin)
+            if circle is not None:
+                errors.setdefault(method, list()).append(locationError(circle, truth))
+
+    return timer, errors
+
+# Function main(...) runs the script with the given command line arguments (sys.argv if None).
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 300, 1000],
+        help="Numbers of distinct points per tower to sweep over. Default 100 300 1000")
+    parser.add_argument("--cdmas", type=int, default=5, help="Number of towers in each log. Default 5")
+    parser.add_argument("--duplicates", type=float, default=0.2,
+        help="Fraction of extra rows that repeat an earlier point. Default 0.2")
+    parser.add_argument("--outliers", type=float, default=0.02,
+        help="Fraction of points scattered around the tower instead of on the ring. Default 0.02")
+    parser.add_argument("--radius", type=float, default=0.02,
+        help="Radius of the ring of hand-off points, in degrees. Default 0.02")
+    parser.add_argument("--noise", type=float, default=0.05,
+        help="Standard deviation of the radial noise, as a fraction of the radius. Default 0.05")
+    parser.add_argument("-s", "--search", choices=TRIANGLE_SEARCHES, default="hull",
+        help="Triangle search mode of cell2.py. Default hull")
+    parser.add_argument("-t", "--triangles", type=int, default=10,
+        help="Number of largest triangles averaged. Default 10")
+    parser.add_argument("-m", "--methods", nargs="*", choices=CIRCLE_METHODS, default=["mec", "kasa", "pratt", "ransac"],
+        help="Estimation methods of cell.py to compare. Default mec kasa pratt ransac")
+    parser.add_argument("-p", "--percent", type=float, default=0.9,
+        help="Percentage of points (as a decimal) used by the cell.py methods. Default 0.9")
+    parser.add_argument("-M", "--metric", action="store_true",
+        help="Project the points onto a local plane in meters before locating the towers.")
+    addThinOption(parser)
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic data. Default 0")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated files (the directory is printed).")
+    args = vars(parser.parse_args(argv))
+
+    workDir = tempfile.mkdtemp(prefix="cell-benchmark-")
+    try:
+        print("size\tstage\tseconds\titems/s")
+        errorLines = list()
+        for numPoints in args["sizes"]:
+            timer, errors = runSize(numPoints, args, workDir)
+            for stage in ["extract", "parse", "dedup", "project", "thin", "search", "solve"] + args["methods"]:
+                if stage not in timer.seconds:
+                    continue
+                seconds = timer.seconds.get(stage, 0.)
+                rate = timer.items[stage] / seconds if seconds > 0 else float("inf")
+                print("{:d}\t{:s}\t{:.4f}\t{:.0f}".format(numPoints, stage, seconds, rate))
+            if "thin" in timer.items:
+                print("{:d}\tthin\tkept {:d} of {:d} points".format(numPoints,
+                    timer.items["thin"] - timer.items["thinned"], timer.items["thin"]))
+            for estimator in ["triangles"] + args["methods"]:
+                towerErrors = errors.get(estimator, list())
+                if len(towerErrors) == 0:
+                    errorLines.append("{:d}\t{:s}\t0\t\t".format(numPoints, estimator))
+                else:
+                    errorLines.append("{:d}\t{:s}\t{:d}\t{:.1f}\t{:.1f}".format(numPoints, estimator,
+                        len(towerErrors), np.median(towerErrors), np.max(towerErrors)))
+
+        print("\nsize\testimator\tlocated\tmedian error (m)\tmax error (m)")
+        for line in errorLines:
+            print(line)
+    finally:
+        if args["keep"]:
+            print("\nGenerated files kept in {:s}".format(workDir))
+        else:
+            shutil.rmtree(workDir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# Bootstrap confidence regions for the tower estimate. The M unique points are resampled with replacement
+# B times; each resample is represented by a B x M array of counts (how often each point was drawn), so
+# that the estimators can be run on all resamples at once:
+#   kasa, pratt     weighted fits, batched over the rows of counts (see circleFit.py)
+#   triangles       the largest-perimeter triangles of a resample are the largest triangles of the full set
+#                   whose three points were all drawn; the top triangles of the full set are found once,
+#                   and each resample picks its own from that list with array operations
+# The remaining estimators of cell.py (search, mec and ransac) have no batched form and are run on each
+# resample in turn. A confidence ellipse and standard errors for the center are then computed from the
+# spread of the B estimated centers.
+
+import numpy as np
+from circleFit import circumcircles, kasaFitWeighted, prattFitWeighted
+from localize import DEFAULT_MAX_RADIUS, locateCircle, locateTriangles
+from triangleSearch import hullTriangles
+
+# Default confidence level of the ellipse.
+DEFAULT_LEVEL = 0.95
+
+# Function resampleCounts(...) draws numResamples bootstrap resamples of numPoints points and returns a
+# numResamples x numPoints array of the number of times each point was drawn in each resample.
+def resampleCounts(numPoints, numResamples, seed=0):
+    rng = np.random.RandomState(seed)
+    draws = rng.randint(0, numPoints, (numResamples, numPoints))
+    rows = numPoints * np.arange(numResamples)[:,np.newaxis]
+    return np.bincount((draws + rows).ravel(), minlength=numResamples * numPoints).reshape(numResamples, numPoints)
+
+# Function bootstrapCircles(...) runs the cell.py estimator `method` (see locateCircle(...) in localize.py)
+# on each of the resamples in counts and returns a B x 3 array of circles (h, k, r), NaN where no circle was
+# found. kasa and pratt are fitted to the resamples with their duplicates, in one batch; the other methods
+# are run on the distinct points of each resample, in their original order.
+def bootstrapCircles(coordArray, counts, method="search", minPerc=0.9, ransacIterations=2000,
+        ransacThreshold=None):
+    if method in ["kasa", "pratt"]:
+        if method == "kasa":
+            circles = kasaFitWeighted(coordArray, counts)
+        else:
+            circles = prattFitWeighted(coordArray, counts)
+        # Accept the fits as locateCircle(...) does: at least 3 distinct points and a radius below maxRadius
+        # of centroidRadii(...), ie, 1.2 times the distance of the farthest distinct point from their centroid.
+        drawn = counts > 0
+        numDrawn = drawn.sum(axis=1)
+        centroids = drawn.dot(coordArray) / numDrawn[:,np.newaxis]
+        pointDist = np.hypot(coordArray[np.newaxis,:,0] - centroids[:,0,np.newaxis],
+            coordArray[np.newaxis,:,1] - centroids[:,1,np.newaxis])
+        maxRadius = 1.2 * np.where(drawn, pointDist, 0.).max(axis=1)
+        with np.errstate(invalid="ignore"):
+            rejected = (numDrawn < 3) | ~np.isfinite(circles[:,2]) | ~(circles[:,2] < maxRadius)
+        circles[rejected] = np.nan
+        return circles
+
+    circles = np.full((len(counts), 3), np.nan)
+    for b in range(len(counts)):
+        circle = locateCircle(coordArray[counts[b] > 0], minPerc, method, ransacIterations, ransacThreshold)
+        if circle is not None:
+            circles[b] = circle
+    return circles
+
+# Function bootstrapTriangles(...) runs the method of triangles/perimeters of cell2.py (see
+# locateTriangles(...) in localize.py) on each of the resamples in counts and returns a B x 3 array of the
+# average circles (h, k, r), NaN where no circle qualified for the average.
+#
+# The numCandidates largest triangles of the full set are found once. The top numTriangles triangles of a
+# resample are the first numTriangles of those whose points were all drawn, provided that the last of them
+# is strictly larger than the smallest candidate (any other triangle of the resample is then smaller).
+# Resamples for which that does not hold are searched on their own.
+def bootstrapTriangles(coordArray, counts, numTriangles=10, maxRadius=DEFAULT_MAX_RADIUS, numCandidates=None):
+    points = np.asarray(coordArray, dtype=float)
+    numPoints = len(points)
+    numCombinations = numPoints * (numPoints - 1) * (numPoints - 2) // 6
+    if numCandidates is None:
+        numCandidates = max(20 * numTriangles, 200)
+    # With fewer than 3 points there is no triangle, and no resample has an estimate.
+    if numCombinations == 0:
+        return np.full((len(counts), 3), np.nan)
+    numCandidates = min(numCandidates, numCombinations)
+    perims, tris = hullTriangles(points, numCandidates)
+    triPoints = points[tris]
+    h, k, r, collinear = circumcircles(triPoints[:,0,:], triPoints[:,1,:], triPoints[:,2,:])
+
+    drawn = counts > 0
+    present = drawn[:,tris[:,0]] & drawn[:,tris[:,1]] & drawn[:,tris[:,2]]
+    rank = np.cumsum(present, axis=1)
+    chosen = present & (rank <= numTriangles)
+    numChosen = chosen.sum(axis=1)
+    lastChosen = np.argmax(rank >= numTriangles, axis=1)
+    if numCandidates == numCombinations:
+        exact = np.ones(len(counts), dtype=bool)
+    else:
+        exact = (numChosen == numTriangles) & (perims[lastChosen] > perims[-1])
+
+    # Average the circles of the chosen triangles that qualify (see averageCircles(...) in localize.py).
+    qualifies = ~collinear & (r <= maxRadius)
+    used = chosen & qualifies[np.newaxis,:]
+    numUsed = used.sum(axis=1)
+    triCircles = np.where(qualifies[:,np.newaxis], np.column_stack((h, k, r)), 0.)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        circles = used.dot(triCircles) / numUsed[:,np.newaxis]
+    circles[numUsed == 0] = np.nan
+
+    for b in np.nonzero(~exact)[0]:
+        circle = locateTriangles(points[drawn[b]], numTriangles, "hull", maxRadius)
+        circles[b] = np.nan if circle is None else circle
+    return circles
+
+# Function confidenceEllipse(...) summarizes the spread of the bootstrap centers (the first two columns of
+# circles; NaN rows are left out). Outputs a dict with
+#   center      mean of the centers
+#   stdErr      standard error of each coordinate of the center (standard deviation of the centers)
+#   axes        semi-axes (major, minor) of the confidence ellipse at the given level
+#   angle       angle of the major axis from the first coordinate axis, in radians
+#   rotation    2 x 2 array whose columns are the directions of the major and minor axes
+#   valid       number of resamples with a center
+# The ellipse is the region of the given probability of a normal distribution with the covariance of the
+# centers: the eigenvectors of the covariance give the axes, scaled by sqrt(eigenvalue * q), where
+# q = -2 ln(1 - level) is the quantile of the chi-squared distribution with 2 degrees of freedom.
+def confidenceEllipse(circles, level=DEFAULT_LEVEL):
+    centers = circles[:,:2][~np.isnan(circles[:,:2]).any(axis=1)]
+    if len(centers) < 3:
+        return None
+    covariance = np.cov(centers, rowvar=False)
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    eigenvalues = np.maximum(eigenvalues[::-1], 0.)
+    eigenvectors = eigenvectors[:,::-1]
+    quantile = -2. * np.log(1. - level)
+    return {"center": centers.mean(axis=0), "stdErr": np.sqrt(np.diag(covariance)),
+        "axes": np.sqrt(eigenvalues * quantile), "angle": np.arctan2(eigenvectors[1,0], eigenvectors[0,0]),
+        "rotation": eigenvectors, "valid": len(centers)}
+
+# Function ellipseOutline(...) returns resolution points on the outline of an ellipse from
+# confidenceEllipse(...), as a resolution x 2 array in the units of the centers.
+def ellipseOutline(ellipse, resolution=100):
+    theta = np.linspace(0, 2 * np.pi, resolution)
+    unitCircle = np.column_stack((ellipse["axes"][0] * np.cos(theta), ellipse["axes"][1] * np.sin(theta)))
+    return ellipse["center"] + unitCircle.dot(ellipse["rotation"].T)
+
+# Function describeEllipse(...) returns a one-line summary of an ellipse from confidenceEllipse(...) for
+# numResamples resamples, with lengths in the given units ("" for degrees, " m" for meters).
+def describeEllipse(ellipse, numResamples, units="", level=DEFAULT_LEVEL):
+    if ellipse is None:
+        return "Bootstrap: too few of the {:d} resamples gave an estimate.".format(numResamples)
+    return ("Bootstrap ({:d} of {:d} resamples located): standard error of center = {:f}{:s} (latitude)," +
+        " {:f}{:s} (longitude). {:.0f}% confidence ellipse semi-axes = {:f}{:s} and {:f}{:s}, major axis at" +
+        " {:.1f} degrees from the latitude axis.").format(ellipse["valid"], numResamples, ellipse["stdErr"][0],
+        units, ellipse["stdErr"][1], units, 100. * level, ellipse["axes"][0], units, ellipse["axes"][1], units,
+        np.degrees(ellipse["angle"]))
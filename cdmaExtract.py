@@ -0,0 +1,356 @@
+# Extraction of the coordinates of each cell tower (CDMA) from Tasker output, as used by formatCoords.py.
+# Rows are lists of strings as returned by csv.reader; the positions of the CDMA, latitude and longitude
+# columns are given as a tuple columns = (cdmaInd, latInd, lonInd). Coordinates are written to files named
+# "[CDMA number]-[file number].txt" in an output directory (the current directory by default), without
+# overwriting earlier files of the same CDMA.
+#
+# The latest instance number of each CDMA in an output directory is kept in a manifest file there (see
+# loadInstances(...)), so that the directory does not have to be listed on every run.
+#
+# Instead of text files, the coordinates can also be added to a single container file (see
+# writeContainerCDMA(...) and coordIO.py).
+#
+# Large files can be parsed in several processes, in ranges of lines that are merged in file order (see
+# parallelGroupByCDMA(...)).
+
+import csv
+import io
+import itertools
+import json
+import os
+import re   # regex
+import tempfile
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from coordIO import writeContainer, CoordContainer
+
+# Default positions of the CDMA, latitude and longitude columns (first column = 0).
+DEFAULT_COLUMNS = (2, 3, 4)
+
+# Pattern of the formatted coordinate files; group 1 is the CDMA and group 2 the instance number.
+FILE_PATTERN = re.compile(r'^([0-9]+)-([0-9]+)\.txt$')
+
+# Name of the manifest of the latest instance of each CDMA, kept in the output directory.
+MANIFEST_NAME = "cdmaManifest.json"
+
+# Smallest byte range parsed by one worker of parallelGroupByCDMA(...).
+DEFAULT_MIN_CHUNK_SIZE = 1024 * 1024
+
+# Names of the special delimiter characters accepted by formatCoords.py --delim.
+DELIMITERS = {"tab": "\t", "cr": "\r", "nl": "\n", "sp": " "}
+
+# Function getDelimiter(...) returns the delimiter character for a --delim value: one of the names in
+# DELIMITERS, any other string as is, or tab if None.
+def getDelimiter(name):
+    if name is None:
+        return "\t"
+    return DELIMITERS.get(name, name)
+
+# Function readRows(...) is a generator that reads the Tasker data one row at a time, starting at row
+# firstLine, so that the file never has to be held in memory.
+def readRows(fileName, delim="\t", firstLine=0):
+    with open(fileName) as inputFile:
+        reader = csv.reader(inputFile, delimiter=delim)
+        for j, row in enumerate(reader):
+            if j >= firstLine:
+                yield row
+
+# Function readAllRows(...) reads the Tasker data into a list of rows, starting at row firstLine.
+def readAllRows(fileName, delim="\t", firstLine=0):
+    with open(fileName) as inputFile:
+        reader = csv.reader(inputFile, delimiter=delim)
+        fileContents = list(reader)
+    return fileContents[firstLine:]
+
+# Function chunkRanges(...) splits a file into about numChunks byte ranges (start, stop) for parseChunk(...),
+# each at least minChunkSize bytes (except the last) and each ending just after a newline, so that no line is
+# split between two ranges. The first range is extended past the first skipLines lines. Data fields must not
+# contain line breaks (as in Tasker output), since a quoted field could then span two ranges.
+def chunkRanges(fileName, numChunks, skipLines=0, minChunkSize=DEFAULT_MIN_CHUNK_SIZE):
+    fileSize = os.path.getsize(fileName)
+    chunkSize = max(fileSize // max(numChunks, 1), minChunkSize)
+    ranges = list()
+    with open(fileName, "rb") as inputFile:
+        for j in range(skipLines):
+            inputFile.readline()
+        start = 0
+        while start < fileSize:
+            inputFile.seek(max(start + chunkSize, inputFile.tell()) - 1)
+            inputFile.readline()
+            stop = min(inputFile.tell(), fileSize)
+            ranges.append((start, stop))
+            start = stop
+    return ranges
+
+# Function parseChunk(...) runs in a worker process and groups the rows in the byte range start:stop of a file
+# by CDMA, like groupByCDMA(...), skipping the first skipRows rows of the range. Returns an OrderedDict that
+# maps each CDMA, in the order in which it first appears in the range, to a K x 2 array of its coordinates.
+def parseChunk(fileName, start, stop, delim="\t", columns=DEFAULT_COLUMNS, skipRows=0):
+    with open(fileName, "rb") as inputFile:
+        inputFile.seek(start)
+        data = inputFile.read(stop - start)
+    # TextIOWrapper decodes and translates line endings as open() does in readAllRows(...).
+    reader = csv.reader(io.TextIOWrapper(io.BytesIO(data)), delimiter=delim)
+    coordsByCdma = groupByCDMA(itertools.islice(reader, skipRows, None), columns)
+    return OrderedDict((cdmaNum, np.array(coordList, dtype=float).reshape(-1, 2))
+        for cdmaNum, coordList in coordsByCdma.items())
+
+# Function parallelGroupByCDMA(...) reads the Tasker data starting at row firstLine and groups the coordinates
+# by CDMA, like groupByCDMA(readAllRows(...)), but parses the file in byte ranges (see chunkRanges(...)) in a
+# pool of `workers` processes (all cores if None). The ranges are merged in file order, so the result is the
+# same as in a single process, except that each CDMA maps to a K x 2 array instead of a list.
+def parallelGroupByCDMA(fileName, delim="\t", firstLine=0, columns=DEFAULT_COLUMNS, workers=None,
+        chunksPerWorker=4):
+    if workers is None:
+        workers = os.cpu_count() or 1
+    ranges = chunkRanges(fileName, workers * chunksPerWorker, firstLine)
+    skipRows = [firstLine] + [0] * (len(ranges) - 1)
+
+    coordsByCdma = OrderedDict()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunks = executor.map(parseChunk, [fileName] * len(ranges), [start for start, stop in ranges],
+            [stop for start, stop in ranges], [delim] * len(ranges), [columns] * len(ranges), skipRows)
+        for chunk in chunks:
+            for cdmaNum, coords in chunk.items():
+                coordsByCdma.setdefault(cdmaNum, list()).append(coords)
+    for cdmaNum in coordsByCdma:
+        coordsByCdma[cdmaNum] = np.concatenate(coordsByCdma[cdmaNum])
+    return coordsByCdma
+
+# Function scanInstances(...) finds the existing formatted coordinate files in a directory, ie, files that
+# match the pattern "[CDMA number]-[file number].txt", and returns a dict that maps each CDMA that is
+# represented to its largest instance number. For example, if the directory contains the following:
+#   ['385-1.txt', '385-2.txt', '385-3.txt', '832-1.txt', '832-4.txt']
+# then the following is returned:
+#   {385: 3, 832: 4}
+def scanInstances(directory="."):
+    instances = dict()
+    for entry in os.listdir(directory):
+        nameMatch = FILE_PATTERN.match(entry)
+        if nameMatch is not None:
+            cdmaNum = int(nameMatch.group(1))
+            instances[cdmaNum] = max(instances.get(cdmaNum, 0), int(nameMatch.group(2)))
+    return instances
+
+# Function readManifest(...) returns the dict of latest instances stored in the manifest of a directory,
+# or None if there is no valid manifest. The manifest may be out of date if files were added or removed by
+# other means; getOutputPath(...) checks the entry of each CDMA before a file is written (see
+# instanceIsCurrent(...)).
+def readManifest(directory="."):
+    manifestPath = os.path.join(directory, MANIFEST_NAME)
+    try:
+        with open(manifestPath) as manifestFile:
+            manifest = json.load(manifestFile)
+        return {int(cdmaNum): int(instance) for cdmaNum, instance in manifest["instances"].items()}
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+# Function writeManifest(...) atomically replaces the manifest of a directory with the given dict of
+# latest instances: the manifest is written to a temporary file in the same directory, which is then
+# renamed over the old one, so that readers see either the old or the new manifest.
+def writeManifest(directory, instances):
+    manifest = {"instances": {str(cdmaNum): instances[cdmaNum] for cdmaNum in sorted(instances)}}
+    handle, tempPath = tempfile.mkstemp(prefix=MANIFEST_NAME + ".", dir=directory)
+    try:
+        with os.fdopen(handle, "w") as manifestFile:
+            json.dump(manifest, manifestFile, indent=0)
+        os.replace(tempPath, os.path.join(directory, MANIFEST_NAME))
+    except:
+        os.remove(tempPath)
+        raise
+
+# Function loadInstances(...) returns the dict that maps each CDMA with files in a directory to its
+# largest instance number, from the manifest if there is a valid one, else by listing the directory with
+# scanInstances(...) (the manifest is then rewritten).
+def loadInstances(directory="."):
+    instances = readManifest(directory)
+    if instances is None:
+        instances = scanInstances(directory)
+        writeManifest(directory, instances)
+    return instances
+
+# Function instanceIsCurrent(...) checks the latest instance of a CDMA in the dict returned by
+# loadInstances(...) against the files in a directory, with two lookups instead of a listing of the
+# directory: "[CDMA]-[latest].txt" must exist (unless there is none) and "[CDMA]-[latest + 1].txt" must not.
+def instanceIsCurrent(cdmaNum, instances, directory="."):
+    latest = instances.get(cdmaNum, 0)
+    if latest > 0 and not os.path.exists(os.path.join(directory, "{:d}-{:d}.txt".format(cdmaNum, latest))):
+        return False
+    return not os.path.exists(os.path.join(directory, "{:d}-{:d}.txt".format(cdmaNum, latest + 1)))
+
+# Function getCoords(...) extracts the latitude and longitude from a row of Tasker data as a
+# [lat, lon] list of floats. Raises an exception if the row does not contain valid coordinates.
+def getCoords(row, columns=DEFAULT_COLUMNS):
+    return [float(row[columns[1]]), float(row[columns[2]])]
+
+# Function getRowCDMA(...) extracts the CDMA from a row of Tasker data.
+# The cells in the CDMA column contain a string formatted as "CDMA:000" where "000" is the relevant number.
+#   The code "int(row[cdmaInd][5:])" extracts the number from the string (char 5 to end) in the row
+#   and converts it to an int. Raises an exception if the row does not contain a valid CDMA.
+def getRowCDMA(row, columns=DEFAULT_COLUMNS):
+    return int(row[columns[0]][5:])
+
+# Function getOutputPath(...) increments the instance number for a given CDMA value in the dict returned
+# by loadInstances(...), and returns the name of the file that its coordinates will be written to, in
+# directory (or the current directory if None).
+def getOutputPath(cdmaNum, instances, directory=None):
+    # If the manifest is out of date for this CDMA (files were added or removed by other means), list the
+    # directory again, so that no file is overwritten.
+    outputDir = directory if directory is not None else "."
+    if not instanceIsCurrent(cdmaNum, instances, outputDir):
+        instances.clear()
+        instances.update(scanInstances(outputDir))
+    instanceNumToWrite = instances.get(cdmaNum, 0) + 1
+    instances[cdmaNum] = instanceNumToWrite
+    outputPath = str(cdmaNum) + "-" + str(instanceNumToWrite) + ".txt"
+    if directory is not None:
+        outputPath = os.path.join(directory, outputPath)
+    return outputPath
+
+# Function writeCDMA(...) writes the coordinates in coordList for a given CDMA value to a text file in a
+# standardized format.
+def writeCDMA(cdmaNum, coordList, instances, directory=None):
+    # Check if coordList empty.
+    if len(coordList) == 0:
+        print("Error: no matching CDMA entries found for CDMA {:d}.".format(cdmaNum))
+    else:
+        # If coordList not empty, write coordList contents to file.
+        outputPath = getOutputPath(cdmaNum, instances, directory)
+        with open(outputPath, "w") as output:
+            writer = csv.writer(output, lineterminator='\n', delimiter='\t')
+            for k in range(len(coordList)):
+                writer.writerow(coordList[k])
+        print("\n{:d} coordinates successfully written to {:s}".format(len(coordList),outputPath))
+
+# Function writeContainerCDMA(...) adds the coordinates of each CDMA in coordsByCdma (a dict that maps
+# each CDMA to its list of [lat, lon] coordinates) to the container file containerPath as a new instance,
+# creating the file if it does not exist. The existing towers of the container are kept. The whole file is
+# rewritten once, and replaced atomically.
+def writeContainerCDMA(containerPath, coordsByCdma):
+    towers = list()
+    instances = dict()
+    if os.path.exists(containerPath):
+        container = CoordContainer(containerPath)
+        instances = container.latestInstances()
+        # Each tower is a slice of the memory-mapped coordinates, which writeContainer() copies before the
+        # file is replaced.
+        offset = container.offset
+        for tower, (cdmaNum, instance) in enumerate(container.towers()):
+            towers.append((cdmaNum, instance, container.coords[offset[tower]:offset[tower + 1]]))
+
+    written = list()
+    for cdmaNum, coordList in coordsByCdma.items():
+        if len(coordList) == 0:
+            print("Error: no matching CDMA entries found for CDMA {:d}.".format(cdmaNum))
+            continue
+        instances[cdmaNum] = instances.get(cdmaNum, 0) + 1
+        towers.append((cdmaNum, instances[cdmaNum], coordList))
+        written.append((cdmaNum, instances[cdmaNum], len(coordList)))
+
+    if len(written) > 0:
+        writeContainer(containerPath, towers)
+    for cdmaNum, instance, count in written:
+        print("\n{:d} coordinates successfully written to {:s} (CDMA {:d}, instance {:d})".format(count,
+            containerPath, cdmaNum, instance))
+
+# Function extractCDMA(...) returns the list of [lat, lon] coordinates of the rows with a given CDMA value.
+def extractCDMA(rows, cdmaNum, columns=DEFAULT_COLUMNS):
+    # The latitude and longitude are converted from str to float and appended to coordList if the CDMA matches.
+    coordList = list()
+    for row in rows:
+        # try/except statement handles case where the CDMA is not an integer by continuing to the next iteration
+        try:
+            if getRowCDMA(row, columns) == cdmaNum:
+                coordList.append(getCoords(row, columns))
+        except:
+            pass
+    return coordList
+
+# Function getCDMA(...) extracts the relevant data for a given CDMA value from a list of rows, then
+# writes it to a text file in a standardized format.
+def getCDMA(rows, cdmaNum, instances, columns=DEFAULT_COLUMNS, directory=None):
+    writeCDMA(cdmaNum, extractCDMA(rows, cdmaNum, columns), instances, directory)
+
+# Function groupByCDMA(...) reads every row once and buckets the coordinates by CDMA.
+# Returns an OrderedDict that maps each CDMA, in the order in which it first appears in the file, to
+# its list of [lat, lon] coordinates. A CDMA whose rows contain no valid coordinates maps to an empty
+# list, just as extractCDMA(...) would find no matching entries for it.
+def groupByCDMA(rows, columns=DEFAULT_COLUMNS):
+    coordsByCdma = OrderedDict()
+    for row in rows:
+        # try/except statements handle rows where the CDMA column does not contain an int, or the
+        # latitude or longitude is not a number
+        try:
+            currentCdma = getRowCDMA(row, columns)
+        except:
+            continue
+        coordList = coordsByCdma.setdefault(currentCdma, list())
+        try:
+            coordList.append(getCoords(row, columns))
+        except:
+            pass
+    return coordsByCdma
+
+# Class BufferedCDMAWriter appends the coordinates of one CDMA to its output file in batches of
+# batchSize rows, so that only one batch per CDMA is held in memory. The file is only created
+# once the first batch is written.
+class BufferedCDMAWriter:
+    def __init__(self, cdmaNum, batchSize, instances, directory=None):
+        self.cdmaNum = cdmaNum
+        self.batchSize = batchSize
+        self.instances = instances
+        self.directory = directory
+        self.outputPath = None
+        self.buffer = list()
+        self.count = 0
+
+    def append(self, coords):
+        self.buffer.append(coords)
+        self.count += 1
+        if len(self.buffer) >= self.batchSize:
+            self.flush()
+
+    def flush(self):
+        if len(self.buffer) == 0:
+            return
+        if self.outputPath is None:
+            self.outputPath = getOutputPath(self.cdmaNum, self.instances, self.directory)
+            mode = "w"
+        else:
+            mode = "a"
+        with open(self.outputPath, mode) as output:
+            writer = csv.writer(output, lineterminator='\n', delimiter='\t')
+            writer.writerows(self.buffer)
+        self.buffer = list()
+
+    # Write any remaining coordinates and print the same message as writeCDMA(...).
+    def close(self):
+        self.flush()
+        if self.count == 0:
+            print("Error: no matching CDMA entries found for CDMA {:d}.".format(self.cdmaNum))
+        else:
+            print("\n{:d} coordinates successfully written to {:s}".format(self.count, self.outputPath))
+
+# Function streamCDMA(...) reads the rows one at a time and appends the coordinates of each CDMA (or
+# only those of cdmaNum, if given) to its output file through a BufferedCDMAWriter. Peak memory depends
+# on the number of CDMAs, not the number of rows. Returns an OrderedDict of the writers, keyed by CDMA
+# in the order in which each first appears. Writers are not closed.
+def streamCDMA(rows, batchSize, instances, columns=DEFAULT_COLUMNS, cdmaNum=None, directory=None):
+    writers = OrderedDict()
+    for row in rows:
+        # try/except statements handle rows where the CDMA column does not contain an int, or the
+        # latitude or longitude is not a number
+        try:
+            currentCdma = getRowCDMA(row, columns)
+        except:
+            continue
+        if cdmaNum is not None and currentCdma != cdmaNum:
+            continue
+        if currentCdma not in writers:
+            writers[currentCdma] = BufferedCDMAWriter(currentCdma, batchSize, instances, directory)
+        try:
+            writers[currentCdma].append(getCoords(row, columns))
+        except:
+            pass
+    return writers
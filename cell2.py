@@ -2,241 +2,194 @@
 # Script determines perimeters of the largest triangles formed by 10 sets of 3 points,
 # computes the coordinates of the center of the circle formed by each triangle, then
 # uses the average circle center location as its estimate for the true center.
+# The search and circle computations are importable from localize.py and triangleSearch.py; this script is
+# the command line wrapper around them (see main()).
 debug = False
 
-import math
-import numpy as np
-import csv
 import argparse
-import matplotlib.pyplot as plt
-from operator import itemgetter
 import time
-
-PI = math.pi
-
-# Define square function; improves code readability
-def sqr(val):
-    return val * val
-
-parser = argparse.ArgumentParser()
-parser.add_argument("filename", type=str)
-args = vars(parser.parse_args())
-fileName = args["filename"]
-verbose = True
-
-# Import tab-delimited text file of lat and long coords into an M x 2 array of coordinates,
-# where [m,0] corresponds to the latitude of a particular point m and [m,1] corresponds
-# to the longitude of a particular point m, and there are M total points.
-
-# coordList will be the array containing M rows, where column 0 corresponds to the
-# latitude of a point and column 1 corresponds to the longitude of a point.
-# Since these are imported from a text file, the values are strings. They will be
-# copied into the array coordArray as floats.
-if verbose: print("Importing file... ")
-with open(fileName) as logFile:
-    gpsReader = csv.reader(logFile, delimiter='\t')
-    coordList = list(gpsReader)
-if verbose: print("File imported!\nRemoving duplicate points... ")
-
-# Remove duplicate points.
-coordListUnique = list()        # list to hold all unique points
-isDuplicate = False
-for i in range(len(coordList)):
-    # Get the current latitude and longitude from coordList.
-    # Loop through coordListUnique to check if the point (currentLat, currentLon) already exists.
-    isDuplicate = False
-    currentLat = float(coordList[i][0])
-    currentLon = float(coordList[i][1])
-    for j in range(len(coordListUnique)):
-        if (coordListUnique[j][0] == currentLat) and (coordListUnique[j][1] == currentLon):
-            isDuplicate = True
-            break
-    
-    if not isDuplicate:
-        coordListUnique.append([currentLat, currentLon])
-
-# Put the coordinates from coordListUnique into the numpy array coordArray
-coordArray = np.zeros((len(coordListUnique), 2))
-for i in range(len(coordListUnique)):
-    coordArray[i,0] = coordListUnique[i][0]
-    coordArray[i,1] = coordListUnique[i][1]
-if verbose: print("Duplicate points removed!\n")
-
-if debug: print(coordArray)
-
-# Find the numTriangles sets of three points that form the triangles with the largest perimeters.
-# These sets and their perimeters will be stored in the list triList.
-numTriangles = 10       # The number of sets of points.
-triList = list()
-currentPerim = 0        # Variable to store perimeter during each loop iteration
-
-# Define function perimeter() to compute perimeter of the triangle formed by 3 points. Accepts
-# three numpy 1x2 arrays and outputs a single scalar value.
-def perimeter(point1, point2, point3):
-    side1 = np.linalg.norm(point2 - point1)
-    side2 = np.linalg.norm(point3 - point1)
-    side3 = np.linalg.norm(point3 - point2)
-    return side1 + side2 + side3
-
-numPoints = len(coordArray[:,0])
-numCombinations = math.factorial(numPoints) / (math.factorial(numPoints - 3) * math.factorial(3))
-if verbose:
-    print("Preparing to compute triangle perimeters. There are {:d} points".format(numPoints) +
-        " and {:d} possible combinations.\n".format(numCombinations))
-    
-iteration = 0       # var to track iterations
-initialTime = time.time() 
-currentTime = initialTime
-updateOnPercent = 5  # percent of complete to update calculation time to cmd
-calcPercent = updateOnPercent*numCombinations/100
-for i in range(len(coordArray[:,0]) - 2):
-    for j in range(i+1, len(coordArray[:,0]) - 1):
-        for k in range(j+1, len(coordArray[:,0])):
-            iteration += 1
-            if verbose==True and iteration % calcPercent == 0:
-                lastTime = currentTime
-                currentTime = time.time()
-                timeSinceLast = currentTime - lastTime
-                rate = calcPercent / timeSinceLast
-                timeLeft = (numCombinations - iteration) / rate
-                print("{:d} / {:d} combinations ({:.1f}%) completed".format(
-                    iteration, numCombinations, 100. * iteration / numCombinations)
-                    + " in {:.3f} seconds. ".format(currentTime - initialTime)
-                    + "Estimated {:.3f} seconds remaining.\n".format(timeLeft))
-
-            currentPerim = perimeter(coordArray[i,:], coordArray[j,:], coordArray[k,:])
-            
-            # Check length of triList. If it doesn't already have numTriangles values in
-            # it, simply append currentPerim and the current set of points to the list,
-            # then sort the list. Otherwise, check if currentPerim is greater than any
-            # of the perimeters currently in the list; if it is, remove the appropriate
-            # value, then insert currentPerim in its spot.
-            if len(triList) < numTriangles:
-                triList.append([currentPerim, coordArray[i,:], coordArray[j,:], coordArray[k,:]])
-                # Sort by first index of the entries in triList; ascending order
-                triList.sort(key=itemgetter(0), reverse=True)
-            else:
-                for index, entry in enumerate(triList):
-                    if currentPerim > entry[0]:
-                        triList.pop(index)
-                        triList.insert(index, [currentPerim,coordArray[i,:],coordArray[j,:], coordArray[k,:]])
-                        # Some interesting debug/tracking info
-			print("New perim to top 10: {:f}\n".format(currentPerim))
-                        break
-
-# Use the function getCircle(...) to compute the coordinates of the center of the circle
-# generated by three arbitrary points, as well as the radius of the circle.
-#   The center coordinates are computed as follows. First, use the three points
-#   (x1, y1), (x2, y2), and (x3, y3) to write three equations for the circle:
-#   (x1 - h)^2 + (y1 - k)^2 = r^2   (1)
-#   (x2 - h)^2 + (y2 - k)^2 = r^2   (2)
-#   (x3 - h)^2 + (y3 - k)^2 = r^2   (3)
-#
-#       where (h, k) are the coordinates of the center of the circle and r is its radius.
-#
-#   Subtract equation 2 from equation 1 to get an equation that eliminates r. Then subtract
-#   equation 3 from equation 1 to get a second equation that eliminates r. The choices of
-#   equations to subtract from one another are arbitrary; the goal is to obtain a system
-#   of 2 equations containing the terms x1, x2, x3, y1, y2, y3, x, and h, eliminating r.
-#
-#   Then the system of equations can be written in the form Mx=b, where M is a 2x2 coefficient
-#   matrix consisting of terms of x1, x2, x3, y1, y2, and y3; x is the solution vector [h, k];
-#   and b is the ordinate vector consisting of terms of x1, x2, x3, y1, y2, and y3. In long form:
-#
-#   [A  B]  [h] =   [C]    
-#   [D  E]  [k]     [F]
-#
-#   This system can be solved for h and k. After h and k have been determined, any one of the
-#   equations 1, 2, or 3 can be used to determine r.
-#
-# Function getCircle(...) accepts three 1x2 numpy arrays: three pairs of (x,y) coordinates.
-# Outputs a 3-tuple containing (h, k, r).
-def getCircle(p1, p2, p3):
-    lat1 = p1[0]
-    lon1 = p1[1]
-    lat2 = p2[0]
-    lon2 = p2[1]
-    lat3 = p3[0]
-    lon3 = p3[1]
-
-    # TODO: CHECK FOR COLLINEARITY
-
-    A = lat2 - lat1
-    B = lon2 - lon1
-    C = -0.5 * (sqr(lat1) - sqr(lat2) + sqr(lon1) - sqr(lon2))
-    D = lat3 - lat1
-    E = lon3 - lon1
-    F = -0.5 * (sqr(lat1) - sqr(lat3) + sqr(lon1) - sqr(lon3))
-    
-    circleOrigin = np.linalg.lstsq(np.array([[A, B], [D, E]]), np.array([[C], [F]]))
-    h = circleOrigin[0][0]
-    k = circleOrigin[0][1]
-
-    r = math.sqrt(sqr(lat1 - h) + sqr(lon1 - k))
-    return (h, k, r)
-
-# Compute the center and radius of the points formed by each of the above triangles.
-# Array column 0 = latitude (h), 1 = longitude (k), 2 = radius (r)
-triCircles = np.zeros((numTriangles, 3))
-for i in range(numTriangles):
-    circleCoords = getCircle(triList[i][1], triList[i][2], triList[i][3])
-    triCircles[i,0] = circleCoords[0]
-    triCircles[i,1] = circleCoords[1]
-    triCircles[i,2] = circleCoords[2]
-
-# Plot points as blue dots.
-fig, ax = plt.subplots()
-ax.plot(coordArray[:,1], coordArray[:,0], 'bo')
-
-# Plot triangles and circles formed by triangles in red.
-# Simultaneously compute average circle center coords and average radius.
-circleResolution = 100  # number of points used to construct (the circumference) of circles
-theta = np.linspace(0, 2*PI, circleResolution)
-circleCircumferencePoints = np.zeros((circleResolution, 2))
-
-sumLats = 0
-sumLons = 0
-sumRadii = 0
-numToAverage = 0
-for i in range(numTriangles):
-    # Plot triangle
-    ax.plot([triList[i][1][1], triList[i][2][1], triList[i][3][1]],
-        [triList[i][1][0], triList[i][2][0], triList[i][3][0]], 'r-')
-
-    # Plot circle center
-    h = triCircles[i,0]
-    k = triCircles[i,1]
-    r = triCircles[i,2]
-    ax.plot(k, h, 'r+')
-
-    # Plot circle
-    for j in range(circleResolution):
-        circleCircumferencePoints[j,0] = k + r * math.sin(theta[j])
-        circleCircumferencePoints[j,1] = h + r * math.cos(theta[j])
-
-    ax.plot(circleCircumferencePoints[:,0], circleCircumferencePoints[:,1], 'r-')
-
-    # Remove outliers/unrealistically large circles from average.
-    if r <= 0.25:
-        numToAverage += 1
-        sumLats += h
-        sumLons += k
-        sumRadii += r
-
-# Compute average center and radius.
-avgLat = sumLats / numToAverage
-avgLon = sumLons / numToAverage
-avgRad = sumRadii / numToAverage
-
-# Plot average circle center and radius in black.
-ax.plot(avgLon, avgLat, 'kx', lw=2)
-for j in range(circleResolution):
-    circleCircumferencePoints[j,0] = avgLon + avgRad * math.sin(theta[j])
-    circleCircumferencePoints[j,1] = avgLat + avgRad * math.cos(theta[j])
-ax.plot(circleCircumferencePoints[:,0], circleCircumferencePoints[:,1], 'k-', lw=2)
-
-print("C,{:f},{:f}\n".format(avgLat, avgLon))
-#print("Centers of largest {:d}:".format(numTriangles))
-for i in range(numTriangles):
-    print("{:d},{:f},{:f}".format(i,triCircles[i,0], triCircles[i,1]))
-plt.show()
+import metrics
+from coordIO import loadTowerCoords, describeThinning
+from localize import TRIANGLE_SEARCHES, DEFAULT_MAX_RADIUS, DEFAULT_MAX_RADIUS_METERS, prepareCoords, toLatLon, \
+    triangleEstimate
+from plotting import circleOutlines, getPyplot, lineCollection, finishPlot
+from commonOptions import addCommonOptions, applyCommonOptions
+from bootstrap import resampleCounts, bootstrapTriangles, confidenceEllipse, ellipseOutline, describeEllipse
+
+# Function main(...) runs the script with the given command line arguments (sys.argv if None).
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("filename", type=str)
+    parser.add_argument("-s", "--search", choices=TRIANGLE_SEARCHES, default="exhaustive",
+        help="Triangle search mode. 'exhaustive' evaluates every set of 3 points; 'hull' only evaluates points" +
+        " on or near the convex hull and gives the same result. Default exhaustive")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+        help="Number of processes sharing the exhaustive search (0 = one per core). The result is the same as" +
+        " with a single process. Default 1")
+    parser.add_argument("-b", "--time-budget", type=float, default=None,
+        help="Instead of searching all sets of 3 points, sample random sets (favoring points far from the centroid)" +
+        " for this many seconds and use the largest triangles found. Overrides --search.")
+    parser.add_argument("--self-check", action="store_true",
+        help="With --search hull, also run the exhaustive search and verify that the results match.")
+    addCommonOptions(parser)
+    parser.add_argument("-M", "--metric", action="store_true",
+        help="Project the points onto a local plane in meters before computing triangles and circles. Radii" +
+        " (including --max-radius) are then in meters.")
+    parser.add_argument("-r", "--max-radius", type=float, default=None,
+        help="Largest circle radius included in the average. Default 0.25 (degrees), or" +
+        " {:.0f} with --metric".format(DEFAULT_MAX_RADIUS_METERS))
+    args = vars(parser.parse_args(argv))
+    applyCommonOptions(args)
+    fileName = args["filename"]
+    searchMode = args["search"]
+    selfCheck = args["self_check"]
+    timeBudget = args["time_budget"]
+    numWorkers = args["workers"]
+    metric = args["metric"]
+    thinSize = args["thin"]
+    numResamples = args["bootstrap"]
+    plotMode = args["plot"]
+    plotFile = args["plot_file"]
+    maxRadius = args["max_radius"]
+    if maxRadius is None:
+        maxRadius = DEFAULT_MAX_RADIUS_METERS if metric else DEFAULT_MAX_RADIUS
+    useCache = not args["no_cache"]
+    verbose = True
+
+    # Import tab-delimited text file of lat and long coords into an M x 2 array of coordinates,
+    # where [m,0] corresponds to the latitude of a particular point m and [m,1] corresponds
+    # to the longitude of a particular point m, and there are M total points. Duplicate points
+    # are removed, keeping the first occurrence of each. The result is cached next to the input
+    # file and reused while the file is unchanged. With --cdma, the coordinates of that CDMA are
+    # memory-mapped from a container file instead (see coordIO.py).
+    if verbose: print("Importing file and removing duplicate points... ")
+    with metrics.stage("load"):
+        coordArray = loadTowerCoords(fileName, args["cdma"], args["instance"], useCache)
+    if verbose: print("Duplicate points removed!\n")
+
+    if debug: print(coordArray)
+
+    # In metric mode, project the points once onto a local plane in meters around their centroid (see
+    # projection.py), and optionally thin them to one point per grid cell of size thinSize, in the units of
+    # workArray (see prepareCoords() in localize.py). All triangle and circle computations are then done on
+    # workArray, and only the circle centers are converted back to latitude and longitude.
+    numUnthinned = len(coordArray)
+    coordArray, workArray, origin = prepareCoords(coordArray, metric, thinSize)
+    if thinSize is not None:
+        print(describeThinning(len(coordArray), numUnthinned))
+
+    # Find the numTriangles sets of three points that form the triangles with the largest perimeters.
+    # The point indices of these sets are returned in the rows of triIndices, in descending order of
+    # perimeter, as [point1, point2, point3]. The search itself is done in blocks of
+    # triples by largestTriangles(), or over the hull-pruned candidate set by hullTriangles()
+    # (see triangleSearch.py).
+    numTriangles = 10       # The number of sets of points.
+
+    numPoints = len(coordArray[:,0])
+    numCombinations = numPoints * (numPoints - 1) * (numPoints - 2) // 6
+    if verbose:
+        print("Preparing to compute triangle perimeters. There are {:d} points".format(numPoints) +
+            " and {:d} possible combinations.\n".format(numCombinations))
+
+    initialTime = time.time()
+    updateOnPercent = 5  # percent of complete to update calculation time to cmd
+    progressState = {"lastTime": initialTime, "lastIteration": 0,
+        "nextUpdate": updateOnPercent * numCombinations / 100.}
+
+    # Function printProgress(...) is passed to largestTriangles() and prints the number of combinations
+    # evaluated, elapsed time and estimated time remaining every updateOnPercent percent.
+    def printProgress(iteration, numCombinations):
+        if iteration < progressState["nextUpdate"] or iteration == progressState["lastIteration"]:
+            return
+        currentTime = time.time()
+        timeSinceLast = max(currentTime - progressState["lastTime"], 1e-9)
+        rate = (iteration - progressState["lastIteration"]) / timeSinceLast
+        timeLeft = (numCombinations - iteration) / rate
+        print("{:d} / {:d} combinations ({:.1f}%) completed".format(
+            iteration, numCombinations, 100. * iteration / numCombinations)
+            + " in {:.3f} seconds. ".format(currentTime - initialTime)
+            + "Estimated {:.3f} seconds remaining.\n".format(timeLeft))
+        progressState["lastTime"] = currentTime
+        progressState["lastIteration"] = iteration
+        progressState["nextUpdate"] = iteration + updateOnPercent * numCombinations / 100.
+
+    # Function recordSampled(...) is passed to triangleCircles() with --time-budget instead of
+    # printProgress(), and records the number of triples sampled so far.
+    def recordSampled(numSampled, numCombinations):
+        progressState["lastIteration"] = numSampled
+
+    # Then compute the center and radius of the circle formed by each of these triangles in one batch, and
+    # the average circle center coords and average radius, removing outliers/unrealistically large circles
+    # (r > maxRadius) from the average (see triangleEstimate() in localize.py).
+    # Array column 0 = latitude (h), 1 = longitude (k), 2 = radius (r)
+    # Collinear triangles have no circumcircle; their row is NaN and they are left out of the average.
+    # The centers of the circles (and of the average circle) are also given in latitude and longitude.
+    with metrics.stage("search"):
+        if timeBudget is not None:
+            estimate = triangleEstimate(workArray, origin, numTriangles, searchMode, maxRadius,
+                progress=recordSampled, timeBudget=timeBudget)
+        else:
+            estimate = triangleEstimate(workArray, origin, numTriangles, searchMode, maxRadius, selfCheck,
+                progress=printProgress if verbose else None, workers=numWorkers)
+    if timeBudget is not None:
+        numSampled = progressState["lastIteration"]
+        print("Sampled {:d} sets of 3 points ({:.4g}% of {:d}) in {:.3f} seconds.\n".format(numSampled,
+            100. * numSampled / max(numCombinations, 1), numCombinations, time.time() - initialTime))
+    triIndices = estimate["triIndices"]
+    triCircles = estimate["triCircles"]
+    triCollinear = estimate["triCollinear"]
+    triCenters = estimate["triCenters"]
+    avgLat, avgLon = estimate["lat"], estimate["lon"]
+    numTriangles = len(triIndices)
+
+    # Function circleLonLat(...) returns the outlines of the circles (h, k, r) in the rows of circles (see
+    # circleOutlines() in plotting.py), converted from the units of workArray to (longitude, latitude)
+    # points for plotting, as a numCircles x circleResolution x 2 array.
+    def circleLonLat(circles):
+        outlines = circleOutlines(circles)
+        outlines = toLatLon(outlines.reshape(-1, 2), origin).reshape(outlines.shape)
+        return outlines[:,:,::-1]
+
+    if plotMode != "none":
+        plt = getPyplot(plotMode)
+
+        # Plot points as blue dots.
+        fig, ax = plt.subplots()
+        ax.plot(coordArray[:,1], coordArray[:,0], 'bo')
+
+        # Plot triangles, circle centers and circles formed by triangles in red, with one collection each
+        # for the triangles and the circles. Collinear triangles have no circle.
+        ax.add_collection(lineCollection(coordArray[triIndices][:,:,::-1], colors='r'))
+        hasCircle = ~triCollinear
+        ax.plot(triCenters[hasCircle,1], triCenters[hasCircle,0], 'r+')
+        ax.add_collection(lineCollection(circleLonLat(triCircles[hasCircle]), colors='r'))
+
+        # Plot average circle center and radius in black.
+        ax.plot(avgLon, avgLat, 'kx', lw=2)
+        avgOutline = circleLonLat([estimate["avgCircle"]])[0]
+        ax.plot(avgOutline[:,0], avgOutline[:,1], 'k-', lw=2)
+        ax.autoscale_view()
+
+    # Optionally estimate the uncertainty of the center by rerunning the method on bootstrap resamples of
+    # the points (see bootstrap.py), and draw the confidence ellipse of the center in magenta.
+    if numResamples is not None:
+        with metrics.stage("bootstrap"):
+            counts = resampleCounts(len(workArray), numResamples)
+            ellipse = confidenceEllipse(bootstrapTriangles(workArray, counts, numTriangles, maxRadius))
+        print(describeEllipse(ellipse, numResamples, " m" if metric else "") + "\n")
+        if ellipse is not None and plotMode != "none":
+            ellipseCoords = toLatLon(ellipseOutline(ellipse), origin)
+            ax.plot(ellipseCoords[:,1], ellipseCoords[:,0], 'm--')
+
+    print("C,{:f},{:f}\n".format(avgLat, avgLon))
+    #print("Centers of largest {:d}:".format(numTriangles))
+    for i in range(numTriangles):
+        print("{:d},{:f},{:f}".format(i,triCenters[i,0], triCenters[i,1]))
+
+    if args["metrics"] == "json":
+        print(metrics.report())
+    if plotMode != "none":
+        finishPlot(plt, fig, plotMode, plotFile)
+
+if __name__ == "__main__":
+    main()
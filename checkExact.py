@@ -0,0 +1,178 @@
+############################################################################################################
+# Name: checkExact.py
+#
+# Description: Check that the fast code paths give exactly the results of their reference versions, on
+#   random point sets (uniform, noisy rings, and small integer grids, which are full of tied perimeters):
+#       search      largestTriangles(), hullTriangles(), parallelTriangles(), sampledTriangles() (on sets
+#                   small enough to be searched exhaustively) and IncrementalTriangleLocator all give the
+#                   same top triangles, in the same order (ties broken by index), as a brute-force search
+#                   over every set of 3 points
+#       bootstrap   bootstrapTriangles() equals locateTriangles() on each resample, and kasaFitWeighted() and
+#                   prattFitWeighted() equal kasaFit() and prattFit() on the resampled points
+#       parse       the chunked parse of formatCoords.py -j (chunkRanges() and parseChunk(), and
+#                   parallelGroupByCDMA()) equals groupByCDMA() on a log with malformed rows
+#   Mismatches are listed, and the exit status is 1 if there are any. Run it after changing the search, the
+#   bootstrap or the parsing code.
+#
+#   Example:
+#   >> python checkExact.py --trials 300
+#
+############################################################################################################
+
+import argparse
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+import numpy as np
+from collections import OrderedDict
+
+from benchmark import generateLog
+from bootstrap import resampleCounts, bootstrapTriangles
+from cdmaExtract import readAllRows, groupByCDMA, chunkRanges, parseChunk, parallelGroupByCDMA
+from circleFit import kasaFit, prattFit, kasaFitWeighted, prattFitWeighted
+from coordIO import uniqueCoords
+from localize import IncrementalTriangleLocator, locateTriangles
+from triangleSearch import distanceMatrix, largestTriangles, hullTriangles, parallelTriangles, sampledTriangles
+
+# IN THE COMMAND LINE, RUN THIS SCRIPT WITH THE OPTION -h TO PRINT HELP MESSAGE. EXAMPLE:
+# >> python checkExact.py -h
+
+# Function randomPoints(...) returns a random M x 2 array of unique points for trial number trial: uniform
+# in a square, on a noisy ring, or on a small integer grid, in turn.
+def randomPoints(rng, trial, maxPoints):
+    numPoints = rng.randint(3, maxPoints + 1)
+    if trial % 3 == 0:
+        points = rng.uniform(0., 1., (numPoints, 2))
+    elif trial % 3 == 1:
+        theta = rng.uniform(0., 2. * np.pi, numPoints)
+        r = 1. + 0.05 * rng.randn(numPoints)
+        points = np.column_stack((40. + 0.02 * r * np.cos(theta), -75. + 0.02 * r * np.sin(theta)))
+    else:
+        points = rng.randint(0, 6, (numPoints, 2)).astype(float)
+    return uniqueCoords(points)
+
+# Function bruteForceTriangles(...) returns the indices of the numTriangles largest-perimeter triangles of
+# points, by sorting every set of 3 points by (-perimeter, i, j, k). Perimeters are summed as in
+# largestTriangles(), so that ties are the same.
+def bruteForceTriangles(points, numTriangles):
+    dist = distanceMatrix(points)
+    triples = list(itertools.combinations(range(len(points)), 3))
+    perims = [(dist[i, j] + dist[i, k]) + dist[j, k] for i, j, k in triples]
+    order = sorted(range(len(triples)), key=lambda t: (-perims[t], triples[t]))[:numTriangles]
+    return np.array([triples[t] for t in order], dtype=np.intp).reshape(-1, 3)
+
+# Function checkSearch(...) compares each triangle search with the brute-force search and returns the list
+# of mismatches, as strings.
+def checkSearch(rng, trials, maxPoints, workers):
+    mismatches = list()
+    for trial in range(trials):
+        points = randomPoints(rng, trial, maxPoints)
+        if len(points) < 3:
+            continue
+        numTriangles = rng.randint(1, 13)
+        expected = bruteForceTriangles(points, numTriangles)
+
+        numSeed = rng.randint(1, len(points) + 1)
+        incremental = IncrementalTriangleLocator(points[:numSeed], numTriangles)
+        for block in np.array_split(points[numSeed:], 3):
+            incremental.addPoints(block)
+        results = {"exhaustive": largestTriangles(points, numTriangles, blockSize=97)[1],
+            "hull": hullTriangles(points, numTriangles)[1],
+            "parallel": parallelTriangles(points, numTriangles, workers, blockSize=97)[1],
+            "sampled": sampledTriangles(points, numTriangles, 1., blockSize=100000)[1],
+            "incremental": incremental.tris}
+        for name, tris in results.items():
+            if not np.array_equal(tris, expected):
+                mismatches.append("search {:s}, trial {:d} ({:d} points, {:d} triangles)".format(name, trial,
+                    len(points), numTriangles))
+    return mismatches
+
+# Function checkBootstrap(...) compares the batched bootstrap estimators with the estimators run on each
+# resample in turn and returns the list of mismatches, as strings.
+def checkBootstrap(rng, trials, maxPoints):
+    mismatches = list()
+    for trial in range(trials):
+        points = randomPoints(rng, trial, maxPoints)
+        if len(points) < 6:
+            continue
+        counts = resampleCounts(len(points), 20, seed=trial)
+        numTriangles = rng.randint(1, 11)
+        maxRadius = 0.25 if trial % 3 == 1 else 10.
+
+        batched = bootstrapTriangles(points, counts, numTriangles, maxRadius)
+        for b in range(len(counts)):
+            circle = locateTriangles(points[counts[b] > 0], numTriangles, "exhaustive", maxRadius)
+            expected = np.full(3, np.nan) if circle is None else np.array(circle)
+            if not np.allclose(batched[b], expected, rtol=1e-12, atol=1e-12, equal_nan=True):
+                mismatches.append("bootstrap triangles, trial {:d}, resample {:d}".format(trial, b))
+
+        for name, fit, fitWeighted in [("kasa", kasaFit, kasaFitWeighted), ("pratt", prattFit, prattFitWeighted)]:
+            batched = fitWeighted(points, counts)
+            for b in range(len(counts)):
+                expected = np.array(fit(np.repeat(points, counts[b], axis=0)))
+                if np.isfinite(expected).all() and not np.allclose(batched[b], expected, rtol=1e-9, atol=1e-9):
+                    mismatches.append("bootstrap {:s}, trial {:d}, resample {:d}".format(name, trial, b))
+    return mismatches
+
+# Function checkParse(...) compares the chunked parse of a synthetic Tasker log (with malformed rows and a
+# header) with the serial one and returns the list of mismatches, as strings.
+def checkParse(rng, workDir, workers):
+    logName = os.path.join(workDir, "tasker.txt")
+    generateLog(logName, 500, 5, seed=rng.randint(1000))
+    with open(logName) as logFile:
+        lines = logFile.read().splitlines()
+    for index in rng.choice(len(lines), len(lines) // 20, replace=False):
+        lines[index] = ["short", "0\tcell\tCDMA:x1\t40\t-75", "0\tcell\tCDMA:7\tbad\t-75"][index % 3]
+    with open(logName, "w", newline="") as logFile:
+        logFile.write("header\r\n" + "\r\n".join(lines))
+
+    expected = groupByCDMA(readAllRows(logName, "\t", 1))
+    mismatches = list()
+    for chunkSize in [1, 1000, 100000]:
+        merged = OrderedDict()
+        for index, (start, stop) in enumerate(chunkRanges(logName, 10**9, 1, chunkSize)):
+            for cdmaNum, coords in parseChunk(logName, start, stop, "\t", skipRows=1 if index == 0 else 0).items():
+                merged.setdefault(cdmaNum, list()).append(coords)
+        merged = OrderedDict((cdmaNum, np.concatenate(coords)) for cdmaNum, coords in merged.items())
+        results = [("chunks of {:d} bytes".format(chunkSize), merged)]
+        if chunkSize == 1:
+            results.append(("parallelGroupByCDMA", parallelGroupByCDMA(logName, "\t", 1, workers=workers)))
+        for name, result in results:
+            if list(result) != list(expected) or not all(np.array_equal(result[cdmaNum],
+                    np.array(expected[cdmaNum], dtype=float).reshape(-1, 2)) for cdmaNum in expected):
+                mismatches.append("parse, {:s}".format(name))
+    return mismatches
+
+# Function main(...) runs the script with the given command line arguments (sys.argv if None).
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trials", type=int, default=300, help="Number of random point sets per check. Default 300")
+    parser.add_argument("--max-points", type=int, default=30,
+        help="Largest number of points in a random set (the brute-force search is cubic). Default 30")
+    parser.add_argument("-j", "--workers", type=int, default=2,
+        help="Number of processes of the parallel search and parse. Default 2")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random point sets. Default 0")
+    args = vars(parser.parse_args(argv))
+
+    rng = np.random.RandomState(args["seed"])
+    workDir = tempfile.mkdtemp(prefix="cell-check-")
+    try:
+        mismatches = checkSearch(rng, args["trials"], args["max_points"], args["workers"])
+        print("search: {:d} mismatches".format(len(mismatches)))
+        numBefore = len(mismatches)
+        mismatches += checkBootstrap(rng, max(args["trials"] // 10, 1), args["max_points"])
+        print("bootstrap: {:d} mismatches".format(len(mismatches) - numBefore))
+        numBefore = len(mismatches)
+        mismatches += checkParse(rng, workDir, args["workers"])
+        print("parse: {:d} mismatches".format(len(mismatches) - numBefore))
+    finally:
+        shutil.rmtree(workDir)
+
+    for mismatch in mismatches:
+        print("Mismatch: {:s}".format(mismatch))
+    return 1 if len(mismatches) > 0 else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
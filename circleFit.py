@@ -0,0 +1,322 @@
+# Circle computations shared by cell.py and cell2.py.
+
+import math
+import numpy as np
+import metrics
+
+# Triples whose two edge vectors (P2 - P1 and P3 - P1) make an angle with a sine smaller than this
+# are treated as collinear; their circumcircle is undefined (or unrealistically large).
+DEFAULT_COLLINEAR_TOL = 1e-10
+
+# Function circumcircles(...) computes the centers and radii of the circles that pass through each of
+# a batch of point triples.
+#   The center coordinates are computed as follows. First, use the three points
+#   (x1, y1), (x2, y2), and (x3, y3) to write three equations for the circle:
+#   (x1 - h)^2 + (y1 - k)^2 = r^2   (1)
+#   (x2 - h)^2 + (y2 - k)^2 = r^2   (2)
+#   (x3 - h)^2 + (y3 - k)^2 = r^2   (3)
+#
+#       where (h, k) are the coordinates of the center of the circle and r is its radius.
+#
+#   Subtract equation 2 from equation 1 to get an equation that eliminates r. Then subtract
+#   equation 3 from equation 1 to get a second equation that eliminates r. The choices of
+#   equations to subtract from one another are arbitrary; the goal is to obtain a system
+#   of 2 equations containing the terms x1, x2, x3, y1, y2, y3, x, and h, eliminating r.
+#
+#   Then the system of equations can be written in the form Mx=b, where M is a 2x2 coefficient
+#   matrix consisting of terms of x1, x2, x3, y1, y2, and y3; x is the solution vector [h, k];
+#   and b is the ordinate vector consisting of terms of x1, x2, x3, y1, y2, and y3. In long form:
+#
+#   [A  B]  [h] =   [C]
+#   [D  E]  [k]     [F]
+#
+#   This 2x2 system is solved in closed form (Cramer's rule) for every triple at once. To limit
+#   round-off, the points are first shifted so that (x1, y1) is the origin; then C and F reduce to
+#   half the squared lengths of the edges from point 1, and r is simply the length of (h, k).
+#
+# Function circumcircles(...) accepts three M x 2 numpy arrays: the first, second and third point of
+# each of M triples (a single 1x2 point per argument is also accepted). Outputs a 4-tuple of length-M
+# arrays (h, k, r, collinear); for collinear triples, h, k and r are NaN.
+def circumcircles(p1, p2, p3, tol=DEFAULT_COLLINEAR_TOL):
+    p1 = np.atleast_2d(np.asarray(p1, dtype=float))
+    p2 = np.atleast_2d(np.asarray(p2, dtype=float))
+    p3 = np.atleast_2d(np.asarray(p3, dtype=float))
+
+    A = p2[:,0] - p1[:,0]
+    B = p2[:,1] - p1[:,1]
+    D = p3[:,0] - p1[:,0]
+    E = p3[:,1] - p1[:,1]
+    C = 0.5 * (A * A + B * B)
+    F = 0.5 * (D * D + E * E)
+
+    det = A * E - B * D
+    collinear = np.abs(det) <= tol * np.sqrt(4. * C * F)
+    metrics.count("circleSolves", len(det))
+    metrics.count("collinearTriples", np.count_nonzero(collinear))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        hRel = (C * E - B * F) / det
+        kRel = (A * F - C * D) / det
+    hRel[collinear] = np.nan
+    kRel[collinear] = np.nan
+
+    h = p1[:,0] + hRel
+    k = p1[:,1] + kRel
+    r = np.sqrt(hRel * hRel + kRel * kRel)
+    return h, k, r, collinear
+
+# Function boundaryCircle(...) returns the circle (h, k, r) of smallest radius that passes through
+# one, two or three boundary points and contains all of them. Three collinear points are enclosed
+# by the circle whose diameter is the pair of points that are farthest apart.
+def boundaryCircle(boundary):
+    if len(boundary) == 1:
+        return boundary[0][0], boundary[0][1], 0.
+    if len(boundary) == 3:
+        h, k, r, collinear = circumcircles(boundary[0], boundary[1], boundary[2])
+        if not collinear[0]:
+            return h[0], k[0], r[0]
+        pairs = [(boundary[0], boundary[1]), (boundary[0], boundary[2]), (boundary[1], boundary[2])]
+        boundary = max(pairs, key=lambda pair: (pair[0][0] - pair[1][0])**2 + (pair[0][1] - pair[1][1])**2)
+
+    p1, p2 = boundary
+    h = 0.5 * (p1[0] + p2[0])
+    k = 0.5 * (p1[1] + p2[1])
+    return h, k, 0.5 * math.hypot(p2[0] - p1[0], p2[1] - p1[1])
+
+# Function minEnclosingCircle(...) computes the minimum enclosing circle of an M x 2 array of points
+# with Welzl's randomized algorithm, in its iterative form: the points are shuffled, and whenever a
+# point falls outside the current circle, the circle is rebuilt with that point on its boundary.
+# Expected running time is linear in M. The minimum enclosing circle is unique, so the result does not
+# depend on the shuffle; seed only fixes the order of the floating point operations.
+#
+# Outputs a 3-tuple containing (h, k, r).
+def minEnclosingCircle(points, seed=0):
+    points = np.asarray(points, dtype=float)
+    if len(points) == 0:
+        return np.nan, np.nan, np.nan
+    shuffled = points[np.random.RandomState(seed).permutation(len(points))].tolist()
+
+    # A point is outside a circle if it is farther from the center than r, beyond round-off.
+    def outside(p, circle):
+        h, k, r = circle
+        return math.hypot(p[0] - h, p[1] - k) > r * (1. + 1e-12) + 1e-15
+
+    circle = boundaryCircle([shuffled[0]])
+    for i in range(1, len(shuffled)):
+        if not outside(shuffled[i], circle):
+            continue
+        circle = boundaryCircle([shuffled[i]])
+        for j in range(i):
+            if not outside(shuffled[j], circle):
+                continue
+            circle = boundaryCircle([shuffled[i], shuffled[j]])
+            for k in range(j):
+                if outside(shuffled[k], circle):
+                    circle = boundaryCircle([shuffled[i], shuffled[j], shuffled[k]])
+
+    return float(circle[0]), float(circle[1]), float(circle[2])
+
+# Function kasaFit(...) fits a circle to all rows of an M x 2 array of points at once with the Kasa
+# algebraic method: minimize the sum of (x^2 + y^2 + D*x + E*y + F)^2, which is linear in D, E and F,
+# so the fit is a single least-squares solve. The points are shifted to their centroid first to keep
+# the system well conditioned. Outputs a 3-tuple containing (h, k, r), NaN if the points are collinear.
+def kasaFit(points):
+    points = np.asarray(points, dtype=float)
+    centroid = points.mean(axis=0)
+    x = points[:,0] - centroid[0]
+    y = points[:,1] - centroid[1]
+
+    M = np.column_stack((x, y, np.ones(len(points))))
+    b = -(x * x + y * y)
+
+    # For (nearly) collinear points the system is singular, and lstsq would return its minimum-norm
+    # solution, a made-up circle; the same test on the normal equations as kasaFitWeighted(...) rejects it.
+    normal = M.T.dot(M)
+    if not abs(np.linalg.det(normal)) > 1e-12 * max(np.abs(normal).max(), 1e-300)**3:
+        return np.nan, np.nan, np.nan
+    D, E, F = np.linalg.lstsq(M, b, rcond=None)[0]
+
+    hRel = -0.5 * D
+    kRel = -0.5 * E
+    r = math.sqrt(max(hRel * hRel + kRel * kRel - F, 0.))
+    return float(centroid[0] + hRel), float(centroid[1] + kRel), r
+
+# Function prattFit(...) fits a circle to all rows of an M x 2 array of points with the Pratt algebraic
+# method, which normalizes the algebraic distance by the gradient and so, unlike kasaFit(...), is not
+# biased towards small circles when the points only cover an arc. The constrained minimization is
+# solved with a few Newton steps on its characteristic polynomial (Chernov's formulation), using only
+# the moments of the centered points. Outputs a 3-tuple containing (h, k, r), NaN if the points are
+# collinear.
+def prattFit(points, maxIterations=20):
+    points = np.asarray(points, dtype=float)
+    centroid = points.mean(axis=0)
+    x = points[:,0] - centroid[0]
+    y = points[:,1] - centroid[1]
+    z = x * x + y * y
+
+    Mxx = np.mean(x * x)
+    Myy = np.mean(y * y)
+    Mxy = np.mean(x * y)
+    Mxz = np.mean(x * z)
+    Myz = np.mean(y * z)
+    Mzz = np.mean(z * z)
+
+    Mz = Mxx + Myy
+    covXY = Mxx * Myy - Mxy * Mxy
+    A2 = 4. * covXY - 3. * Mz * Mz - Mzz
+    A1 = Mzz * Mz + 4. * covXY * Mz - Mxz * Mxz - Myz * Myz - Mz * Mz * Mz
+    A0 = Mxz * Mxz * Myy + Myz * Myz * Mxx - Mzz * covXY - 2. * Mxz * Myz * Mxy + Mz * Mz * covXY
+
+    # Newton's method on the characteristic polynomial, starting from 0 and stopping once the
+    # polynomial no longer decreases in magnitude.
+    root = 0.
+    value = A0
+    for iteration in range(maxIterations):
+        slope = A1 + root * (2. * A2 + 16. * root * root)
+        if slope == 0.:
+            break
+        rootNew = root - value / slope
+        if rootNew == root or not np.isfinite(rootNew):
+            break
+        valueNew = A0 + rootNew * (A1 + rootNew * (A2 + 4. * rootNew * rootNew))
+        if abs(valueNew) >= abs(value):
+            break
+        root = rootNew
+        value = valueNew
+
+    # For collinear points det is 0 and the circle is NaN.
+    det = root * root - root * Mz + covXY
+    with np.errstate(divide="ignore", invalid="ignore"):
+        hRel = (Mxz * (Myy - root) - Myz * Mxy) / np.float64(det) / 2.
+        kRel = (Myz * (Mxx - root) - Mxz * Mxy) / np.float64(det) / 2.
+        r = np.sqrt(hRel * hRel + kRel * kRel + Mz + 2. * root)
+    return float(centroid[0] + hRel), float(centroid[1] + kRel), float(r)
+
+# Function kasaFitWeighted(...) is a batched kasaFit(...): it fits one circle for each row of a B x M array
+# of weights, where row b gives the weight of each of the M points in fit b (eg, the number of times the
+# point was drawn in a bootstrap resample, so that fit b equals kasaFit(...) on the resampled points).
+# All fits share the weighted sums of one set of monomials, computed as a single matrix product, and their
+# 3 x 3 normal equations are solved as one batch. Outputs a B x 3 array of circles (h, k, r); rows whose
+# system is singular are NaN.
+def kasaFitWeighted(points, weights):
+    points = np.asarray(points, dtype=float)
+    weights = np.atleast_2d(np.asarray(weights, dtype=float))
+    centroid = points.mean(axis=0)
+    x = points[:,0] - centroid[0]
+    y = points[:,1] - centroid[1]
+    z = x * x + y * y
+
+    # Sums over the points of x*x, x*y, x, y*y, y, 1, x*z, y*z and z for each fit.
+    sums = weights.dot(np.column_stack((x * x, x * y, x, y * y, y, np.ones(len(x)), x * z, y * z, z)))
+    Sxx, Sxy, Sx, Syy, Sy, S1, Sxz, Syz, Sz = sums.T
+    normal = np.stack((np.stack((Sxx, Sxy, Sx), axis=1), np.stack((Sxy, Syy, Sy), axis=1),
+        np.stack((Sx, Sy, S1), axis=1)), axis=1)
+    rhs = -np.column_stack((Sxz, Syz, Sz))
+
+    scale = np.abs(normal).max(axis=(1, 2))
+    singular = ~(np.abs(np.linalg.det(normal)) > 1e-12 * np.maximum(scale, 1e-300)**3)
+    normal[singular] = np.eye(3)
+    D, E, F = np.linalg.solve(normal, rhs[:,:,np.newaxis])[:,:,0].T
+
+    hRel = -0.5 * D
+    kRel = -0.5 * E
+    r = np.sqrt(np.maximum(hRel * hRel + kRel * kRel - F, 0.))
+    circles = np.column_stack((centroid[0] + hRel, centroid[1] + kRel, r))
+    circles[singular] = np.nan
+    return circles
+
+# Function prattFitWeighted(...) is a batched prattFit(...), with one fit for each row of a B x M array of
+# weights (see kasaFitWeighted(...)). The weighted moments of each fit are taken about its own weighted
+# centroid, in blocks of fits of about blockSize point weights, and the Newton iterations run on all fits
+# at once. Outputs a B x 3 array of circles (h, k, r).
+def prattFitWeighted(points, weights, maxIterations=20, blockSize=2000000):
+    points = np.asarray(points, dtype=float)
+    weights = np.atleast_2d(np.asarray(weights, dtype=float))
+    weights = weights / weights.sum(axis=1)[:,np.newaxis]
+    numFits, numPoints = weights.shape
+    centroid = points.mean(axis=0)
+    xAll = points[:,0] - centroid[0]
+    yAll = points[:,1] - centroid[1]
+
+    moments = np.zeros((numFits, 8))
+    rowsPerBlock = max(1, blockSize // max(numPoints, 1))
+    for start in range(0, numFits, rowsPerBlock):
+        w = weights[start:start + rowsPerBlock]
+        cx = w.dot(xAll)
+        cy = w.dot(yAll)
+        x = xAll[np.newaxis,:] - cx[:,np.newaxis]
+        y = yAll[np.newaxis,:] - cy[:,np.newaxis]
+        z = x * x + y * y
+        moments[start:start + rowsPerBlock] = np.column_stack((cx, cy, (w * x * x).sum(axis=1),
+            (w * y * y).sum(axis=1), (w * x * y).sum(axis=1), (w * x * z).sum(axis=1), (w * y * z).sum(axis=1),
+            (w * z * z).sum(axis=1)))
+    cx, cy, Mxx, Myy, Mxy, Mxz, Myz, Mzz = moments.T
+
+    Mz = Mxx + Myy
+    covXY = Mxx * Myy - Mxy * Mxy
+    A2 = 4. * covXY - 3. * Mz * Mz - Mzz
+    A1 = Mzz * Mz + 4. * covXY * Mz - Mxz * Mxz - Myz * Myz - Mz * Mz * Mz
+    A0 = Mxz * Mxz * Myy + Myz * Myz * Mxx - Mzz * covXY - 2. * Mxz * Myz * Mxy + Mz * Mz * covXY
+
+    # Newton's method on each characteristic polynomial, as in prattFit(...); a fit stops updating once
+    # its step fails.
+    root = np.zeros(numFits)
+    value = A0.copy()
+    active = np.ones(numFits, dtype=bool)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for iteration in range(maxIterations):
+            slope = A1 + root * (2. * A2 + 16. * root * root)
+            rootNew = root - value / slope
+            valueNew = A0 + rootNew * (A1 + rootNew * (A2 + 4. * rootNew * rootNew))
+            active &= (slope != 0.) & (rootNew != root) & np.isfinite(rootNew) & (np.abs(valueNew) < np.abs(value))
+            if not active.any():
+                break
+            root = np.where(active, rootNew, root)
+            value = np.where(active, valueNew, value)
+
+        det = root * root - root * Mz + covXY
+        hRel = (Mxz * (Myy - root) - Myz * Mxy) / det / 2.
+        kRel = (Myz * (Mxx - root) - Mxz * Mxy) / det / 2.
+        r = np.sqrt(hRel * hRel + kRel * kRel + Mz + 2. * root)
+    return np.column_stack((centroid[0] + cx + hRel, centroid[1] + cy + kRel, r))
+
+# Function ransacFit(...) fits a circle to an M x 2 array of points while ignoring outliers. It draws
+# `iterations` random triples in one batch, solves all of their circumcircles at once, and counts for
+# each circle the points whose distance from the circle is at most `threshold` (the inliers), in blocks
+# of candidate circles. The circle with the most inliers wins, and the final circle is refit to its
+# inliers with `refit` (prattFit by default).
+#
+# If threshold is None, it defaults to 10% of the median distance of the points from their centroid.
+# Outputs a 4-tuple containing (h, k, r, inliers), where inliers is a boolean array of length M.
+def ransacFit(points, iterations=2000, threshold=None, refit=prattFit, seed=0, blockSize=2000000):
+    points = np.asarray(points, dtype=float)
+    numPoints = len(points)
+    if numPoints < 3:
+        return np.nan, np.nan, np.nan, np.zeros(numPoints, dtype=bool)
+    if threshold is None:
+        threshold = 0.1 * np.median(np.hypot(*(points - points.mean(axis=0)).T))
+
+    # Draw the triples. Triples that repeat a point are dropped rather than redrawn.
+    rng = np.random.RandomState(seed)
+    tris = rng.randint(0, numPoints, size=(iterations, 3))
+    tris = tris[(tris[:,0] != tris[:,1]) & (tris[:,0] != tris[:,2]) & (tris[:,1] != tris[:,2])]
+    h, k, r, collinear = circumcircles(points[tris[:,0]], points[tris[:,1]], points[tris[:,2]])
+    h = h[~collinear]
+    k = k[~collinear]
+    r = r[~collinear]
+    if len(r) == 0:
+        return np.nan, np.nan, np.nan, np.zeros(numPoints, dtype=bool)
+
+    # Score every candidate circle against every point with broadcasting.
+    numInliers = np.zeros(len(r), dtype=np.intp)
+    circlesPerBlock = max(1, blockSize // numPoints)
+    for start in range(0, len(r), circlesPerBlock):
+        stop = start + circlesPerBlock
+        dist = np.hypot(points[np.newaxis,:,0] - h[start:stop,np.newaxis],
+            points[np.newaxis,:,1] - k[start:stop,np.newaxis])
+        numInliers[start:stop] = np.count_nonzero(np.abs(dist - r[start:stop,np.newaxis]) <= threshold, axis=1)
+
+    best = np.argmax(numInliers)
+    inliers = np.abs(np.hypot(points[:,0] - h[best], points[:,1] - k[best]) - r[best]) <= threshold
+    hFit, kFit, rFit = refit(points[inliers])
+    return hFit, kFit, rFit, inliers
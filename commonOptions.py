@@ -0,0 +1,48 @@
+# Command line options shared by cell.py and cell2.py (and the --thin option, also used by batchLocate.py and
+# benchmark.py), so that each is defined and documented once.
+
+import metrics
+from coordIO import clearCache
+from plotting import PLOT_MODES
+
+# Function addThinOption(...) adds the --thin option to a command line argument parser.
+def addThinOption(parser):
+    parser.add_argument("--thin", type=float, default=None,
+        help="Thin dense clusters of points before locating: keep one point per grid cell of this size (in meters" +
+        " with --metric, else in degrees).")
+
+# Function addCommonOptions(...) adds the options of cell.py and cell2.py that do not depend on the
+# estimator: input (container and cache), thinning, bootstrap, plotting and metrics.
+def addCommonOptions(parser):
+    addThinOption(parser)
+    parser.add_argument("--bootstrap", type=int, default=None, metavar="B",
+        help="Resample the points B times, rerun the estimate on every resample, and report the standard error" +
+        " of the center and its 95%% confidence ellipse (also drawn on the plot).")
+    parser.add_argument("--cdma", type=int, default=None,
+        help="Read the coordinates of this CDMA from filename, a container file written by formatCoords.py" +
+        " --container, instead of from a coordinate text file.")
+    parser.add_argument("--instance", type=int, default=None,
+        help="With --cdma, the instance of the CDMA to read. Default: the latest")
+    parser.add_argument("--no-cache", action="store_true",
+        help="Do not read or write the cache of parsed coordinates kept next to the input file.")
+    parser.add_argument("--clear-cache", action="store_true",
+        help="Delete the cache of parsed coordinates of the input file before running (it is then rebuilt).")
+    parser.add_argument("--plot", choices=PLOT_MODES, default="show",
+        help="'show' opens the plot in a window, 'file' writes it to --plot-file without a display, 'none' skips" +
+        " plotting. Default show")
+    parser.add_argument("--plot-file", type=str, default=None,
+        help="Image file written with --plot file. Default: the input file name with .png appended")
+    parser.add_argument("--metrics", choices=["json"],
+        help="Collect per-stage timings and counters (rows parsed, duplicates dropped, triples evaluated, circles" +
+        " solved and rejected) and print them in the given format at the end of the run.")
+
+# Function applyCommonOptions(...) acts on the options of addCommonOptions(...) that take effect before the
+# run (clearing the cache, enabling metrics) and fills in the default --plot-file. args is the dict of the
+# parsed options.
+def applyCommonOptions(args):
+    if args["plot_file"] is None:
+        args["plot_file"] = args["filename"] + ".png"
+    if args["clear_cache"]:
+        clearCache(args["filename"])
+    if args["metrics"]:
+        metrics.enable()
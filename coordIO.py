@@ -0,0 +1,226 @@
+# Load and prepare the tab-delimited coordinate files written by formatCoords.py for cell.py and cell2.py,
+# or the coordinates of one tower from a container file written by formatCoords.py --container.
+
+import hashlib
+import json
+import os
+import struct
+import zipfile
+import numpy as np
+import metrics
+
+# Function loadCoords(...) imports a tab-delimited text file of lat and long coords into an M x 2 float64
+# array of coordinates, where [m,0] corresponds to the latitude of a particular point m and [m,1]
+# corresponds to the longitude of a particular point m, and there are M total points. Any columns after
+# the first two are ignored.
+def loadCoords(fileName):
+    coordArray = np.loadtxt(fileName, delimiter="\t", usecols=(0, 1), ndmin=2, dtype=np.float64)
+    metrics.count("rowsParsed", len(coordArray))
+    return coordArray
+
+# Function uniqueCoords(...) removes duplicate points from an M x 2 array of coordinates. The first
+# occurrence of each point is kept and the points stay in the order in which they were first seen,
+# since the result of cell.py depends on that order.
+def uniqueCoords(coordArray):
+    if len(coordArray) == 0:
+        return coordArray
+    _, firstIndex = np.unique(coordArray, axis=0, return_index=True)
+    metrics.count("duplicatesDropped", len(coordArray) - len(firstIndex))
+    return coordArray[np.sort(firstIndex)]
+
+# Function thinIndices(...) returns the indices of the points to keep when thinning an M x 2 array of points
+# on a square grid with cells of size cellSize (in the units of the points: degrees for coordArray, meters
+# for a local array from projection.py). Each point is quantized to its grid cell, and only the first point
+# (in the original order) of each occupied cell is kept. The indices are in ascending order.
+def thinIndices(points, cellSize):
+    if len(points) == 0:
+        return np.arange(0)
+    cells = np.floor(np.asarray(points) / cellSize).astype(np.int64)
+    _, firstIndex = np.unique(cells, axis=0, return_index=True)
+    metrics.count("pointsThinned", len(points) - len(firstIndex))
+    return np.sort(firstIndex)
+
+# Function thinCoords(...) thins an M x 2 array of coordinates on a grid with cells of size cellSize (see
+# thinIndices(...)), measured on workArray, the same points in the units the estimator works in (eg, meters
+# from projection.py; pass coordArray itself for degrees). Outputs a 2-tuple containing the thinned
+# (coordArray, workArray); both are returned unchanged if cellSize is None.
+def thinCoords(coordArray, workArray, cellSize):
+    if cellSize is None:
+        return coordArray, workArray
+    keep = thinIndices(workArray, cellSize)
+    return coordArray[keep], workArray[keep]
+
+# Function describeThinning(...) returns a one-line summary of thinning numPoints points to numKept.
+def describeThinning(numKept, numPoints):
+    return "Thinning kept {:d} of {:d} points ({:.1f}%).".format(numKept, numPoints,
+        100. * numKept / max(numPoints, 1))
+
+# Function loadUniqueCoords(...) combines loadCoords(...) and uniqueCoords(...).
+def loadUniqueCoords(fileName):
+    return uniqueCoords(loadCoords(fileName))
+
+# Function cachePaths(...) returns the names of the cache files kept next to a coordinate file: the
+# deduplicated coordArray as a .npy file, and a .json file with the fingerprint of the source file.
+def cachePaths(fileName):
+    return fileName + ".coords.npy", fileName + ".coords.json"
+
+# Function fileFingerprint(...) returns a dict with the size, modification time and SHA-1 hash of a file.
+# The hash is only computed if `known` (a previous fingerprint) is None or has the same size and
+# modification time; otherwise the file has certainly changed and None is returned for the hash.
+def fileFingerprint(fileName, known=None):
+    fileStat = os.stat(fileName)
+    fingerprint = {"size": fileStat.st_size, "mtime": fileStat.st_mtime_ns, "sha1": None}
+    if known is not None and (known.get("size") != fingerprint["size"] or known.get("mtime") != fingerprint["mtime"]):
+        return fingerprint
+
+    sha1 = hashlib.sha1()
+    with open(fileName, "rb") as sourceFile:
+        for chunk in iter(lambda: sourceFile.read(1 << 20), b""):
+            sha1.update(chunk)
+    fingerprint["sha1"] = sha1.hexdigest()
+    return fingerprint
+
+# Function clearCache(...) deletes the cache files of a coordinate file, if they exist.
+def clearCache(fileName):
+    for path in cachePaths(fileName):
+        if os.path.exists(path):
+            os.remove(path)
+
+# Function loadCachedCoords(...) returns the same array as loadUniqueCoords(...), but keeps it in a binary
+# cache next to the source file (see cachePaths(...)). If the cache exists and the size, modification time
+# and hash of the source file match those recorded when it was written, the array is memory-mapped from the
+# cache (read-only) instead of parsing the text file again. Otherwise the file is parsed and the cache is
+# rebuilt. If useCache is False, the cache is neither read nor written.
+def loadCachedCoords(fileName, useCache=True):
+    if not useCache:
+        return loadUniqueCoords(fileName)
+
+    arrayPath, fingerprintPath = cachePaths(fileName)
+    cached = None
+    if os.path.exists(arrayPath) and os.path.exists(fingerprintPath):
+        try:
+            with open(fingerprintPath) as fingerprintFile:
+                cached = json.load(fingerprintFile)
+        except ValueError:
+            cached = None
+
+    fingerprint = fileFingerprint(fileName, cached)
+    if cached is not None and fingerprint == cached:
+        try:
+            coordArray = np.load(arrayPath, mmap_mode="r")
+            metrics.count("cacheHits")
+            return coordArray
+        except (IOError, ValueError):
+            pass
+
+    coordArray = loadUniqueCoords(fileName)
+    if fingerprint["sha1"] is None:
+        fingerprint = fileFingerprint(fileName)
+
+    # Write to temporary files first and rename, so that a concurrent reader never sees a partial cache.
+    # The fingerprint is written last: a cache without a matching fingerprint is never used.
+    try:
+        if os.path.exists(fingerprintPath):
+            os.remove(fingerprintPath)
+        with open(arrayPath + ".tmp", "wb") as arrayFile:
+            np.save(arrayFile, coordArray)
+        os.replace(arrayPath + ".tmp", arrayPath)
+        with open(fingerprintPath + ".tmp", "w") as fingerprintFile:
+            json.dump(fingerprint, fingerprintFile)
+        os.replace(fingerprintPath + ".tmp", fingerprintPath)
+    except (IOError, OSError):
+        # A read-only directory only means that the file is parsed again next time.
+        pass
+    return coordArray
+
+# A container holds the coordinates of many towers in one uncompressed .npz file with the arrays
+#   coords      N x 2 float64 array of the (lat, lon) coordinates of all towers, one after another
+#   cdma        K int64 array of the CDMA of each tower
+#   instance    K int64 array of the instance number of each tower (as for "[CDMA]-[instance].txt")
+#   offset      K + 1 int64 array; the coordinates of tower t are coords[offset[t]:offset[t+1]]
+# The coordinates are stored as written to the text files, ie, with duplicates. Since the archive is not
+# compressed, coords is memory-mapped straight from the file, and reading one tower only touches its slice.
+
+# Function writeContainer(...) writes a container file from a list of (cdma, instance, coordArray) tuples.
+# The file is written to a temporary file first and renamed, so that readers never see a partial file.
+def writeContainer(fileName, towers):
+    coordArrays = [np.asarray(coords, dtype=np.float64).reshape(-1, 2) for cdma, instance, coords in towers]
+    offset = np.concatenate(([0], np.cumsum([len(coords) for coords in coordArrays]))).astype(np.int64)
+    if len(coordArrays) > 0:
+        coords = np.concatenate(coordArrays)
+    else:
+        coords = np.zeros((0, 2))
+    with open(fileName + ".tmp", "wb") as containerFile:
+        np.savez(containerFile, coords=coords, offset=offset,
+            cdma=np.array([tower[0] for tower in towers], dtype=np.int64),
+            instance=np.array([tower[1] for tower in towers], dtype=np.int64))
+    os.replace(fileName + ".tmp", fileName)
+
+# Function mapArchiveArray(...) memory-maps (read-only) the array stored as member memberName of an
+# uncompressed .npz file.
+def mapArchiveArray(fileName, memberName):
+    with zipfile.ZipFile(fileName) as archive:
+        info = archive.getinfo(memberName)
+    if info.compress_type != zipfile.ZIP_STORED:
+        raise ValueError("{:s} in {:s} is compressed and cannot be memory-mapped".format(memberName, fileName))
+    with open(fileName, "rb") as containerFile:
+        # The member data follows its local file header: 30 bytes, then the name and an extra field.
+        containerFile.seek(info.header_offset)
+        localHeader = containerFile.read(30)
+        nameLength, extraLength = struct.unpack("<HH", localHeader[26:30])
+        containerFile.seek(info.header_offset + 30 + nameLength + extraLength)
+        version = np.lib.format.read_magic(containerFile)
+        if version == (1, 0):
+            shape, fortranOrder, dtype = np.lib.format.read_array_header_1_0(containerFile)
+        else:
+            shape, fortranOrder, dtype = np.lib.format.read_array_header_2_0(containerFile)
+        dataOffset = containerFile.tell()
+    if len(shape) == 0 or shape[0] == 0:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(fileName, dtype=dtype, mode="r", offset=dataOffset, shape=shape,
+        order="F" if fortranOrder else "C")
+
+# Class CoordContainer reads a container file: the table of towers is loaded when the container is
+# opened, and the coordinates are memory-mapped.
+class CoordContainer:
+    def __init__(self, fileName):
+        self.fileName = fileName
+        with np.load(fileName) as archive:
+            self.cdma = archive["cdma"]
+            self.instance = archive["instance"]
+            self.offset = archive["offset"]
+        self.coords = mapArchiveArray(fileName, "coords.npy")
+
+    # Function towers(...) returns the list of (cdma, instance) of the towers in the container.
+    def towers(self):
+        return list(zip(self.cdma.tolist(), self.instance.tolist()))
+
+    # Function latestInstances(...) returns a dict that maps each CDMA in the container to its largest
+    # instance number.
+    def latestInstances(self):
+        instances = dict()
+        for cdmaNum, instance in self.towers():
+            instances[cdmaNum] = max(instances.get(cdmaNum, 0), instance)
+        return instances
+
+    # Function towerCoords(...) returns the M x 2 array of the coordinates of a tower (duplicates
+    # included), by default of the latest instance of the CDMA. Raises KeyError if there is no such tower.
+    def towerCoords(self, cdmaNum, instance=None):
+        match = np.nonzero(self.cdma == cdmaNum)[0]
+        if instance is not None:
+            match = match[self.instance[match] == instance]
+        if len(match) == 0:
+            raise KeyError("CDMA {:d}{:s} not found in {:s}".format(cdmaNum,
+                "" if instance is None else " instance {:d}".format(instance), self.fileName))
+        tower = match[np.argmax(self.instance[match])]
+        coordArray = self.coords[self.offset[tower]:self.offset[tower + 1]]
+        metrics.count("rowsParsed", len(coordArray))
+        return coordArray
+
+# Function loadTowerCoords(...) returns the unique coordinates of one tower, as loadCachedCoords(...): from
+# the coordinate file fileName if cdmaNum is None, else from the container file fileName (the latest
+# instance of the CDMA, unless instance is given).
+def loadTowerCoords(fileName, cdmaNum=None, instance=None, useCache=True):
+    if cdmaNum is None:
+        return loadCachedCoords(fileName, useCache)
+    return uniqueCoords(CoordContainer(fileName).towerCoords(cdmaNum, instance))
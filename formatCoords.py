@@ -19,200 +19,166 @@
 #                       a unique text file for each one (without overwriting previous files of the same
 #                       CDMA number).
 #           2017-07-11  Print number of coordinates written to file; other minor modifications.
+#           2026-10-18  "Extract all" groups the coordinates of every CDMA in a single pass over the file.
+#                       Added streaming mode for input files that are too large to hold in memory.
+#                       The extraction functions moved to cdmaExtract.py so that they can be imported;
+#                       this script is now a command line wrapper around them (see main()).
+#                       Added --destination. The latest instance of each CDMA is read from a manifest in
+#                       the output directory instead of listing the directory on every run.
+#                       Added --container, to write all extracted coordinates into one binary file.
+#                       Added --workers, to parse large input files in several processes.
 #
 ############################################################################################################
 
 import argparse
-import csv
-import types
 import os
-import re   # regex
+from cdmaExtract import getDelimiter, readRows, readAllRows, loadInstances, writeManifest, groupByCDMA, \
+    parallelGroupByCDMA, writeCDMA, streamCDMA, extractCDMA, writeContainerCDMA
 
 # IN THE COMMAND LINE, RUN THIS SCRIPT WITH THE OPTION -h TO PRINT HELP MESSAGE. EXAMPLE:
 # >> python formatCoords.py -h
 
-
-# Configure the command line argument parser
-parser = argparse.ArgumentParser()
-
-parser.add_argument("input-file", help="File name of the desired file (required)")
-parser.add_argument("-n", "--cdma-number", default=0, help="The CDMA of the desired cell tower; default 0")
-parser.add_argument("-d", "--delim", type=str, help="Delimiter. For the following special characters:\n" +
-    "sp (space)\ttab (tab)\tcr (carriage return)\tnl (newline). Default character is tab.")
-parser.add_argument("-c", "--cdma-index", default="2",
-     help="The column index that contains the tower CDMA (first column = 0); default 2")
-parser.add_argument("-a", "--latitude-index", default=3,
-    help="The column index that contains the latitude (first column = 0); default 3")
-parser.add_argument("-o", "--longitude-index", default=4,
-    help="The column index that contains the longitude (first column = 0); default 4")
-parser.add_argument("-f", "--first-line", default=0,
-    help="The row index where actual data begins (first row = 0); default 0")
-parser.add_argument("-X", "--extract-all", action='store_true',
-    help="Extract all CDMAs from the file. Create a text file containing formatted coordinates for each" +
-        " CDMA found. If -X flag and -n flag are used simultaneously, -X takes priority.")
-#TODO:
-#parser.add_argument("-D", "--destination", help="Choose the directory where the text file(s) will be placed.")
-
-args = vars(parser.parse_args())
-
-# Set the delimiter
-if type(args["delim"]) is types.NoneType:
-    delim = "\t"
-elif args["delim"] == "tab":
-    delim = "\t"
-elif args["delim"] == "cr":
-    delim = "\r"
-elif args["delim"] == "nl":
-    delim = "\n"
-elif args["delim"] == "sp":
-    delim = " "
-else:
-    delim = args["delim"]
-
-# Set other parameters
-cdmaInd = int(args["cdma_index"])
-latInd = int(args["latitude_index"])
-lonInd = int(args["longitude_index"])
-firstLine = int(args["first_line"])
-extractAll = args["extract_all"]
-
-# Get list of directory contents
-directoryContents = os.listdir(os.getcwd())
-
-# Get list of existing formatted coordinate CSV text files in the directory, ie, files that
-# match the pattern "[CDMA number]-[file number].txt".
-existingFiles = list()
-for string in directoryContents:
-    fileRegEx = re.search('^[0-9]+-[0-9]+\.txt', string)
-    if type(fileRegEx) is not types.NoneType:
-        existingFiles.append(fileRegEx.group(0))
-
-# From the filename strings in the list existingFiles, get all unique CDMAs that are
-# represented, as well as the largest instance number for each CDMA, and put in cdmaList.
-# For example, if existingFiles (and the directory) contains the following:
-#   ['385-1.txt', '385-2.txt', '385-3.txt', '832-1.txt', '832-4.txt']
-# then the following will be put into cdmaList:
-#   [[385, 3], [832, 4]]
-#
-# Note that cdmaList[0][0] would return the CDMA value of the first unique CDMA, 385.
-# cdmaList[0][1] would return the largest instance number, 3, for CDMA 385.
-#
-# Iterate through existingFiles and evaluate each filename.
-cdmaList = list()
-currentCdmaFromFilename = 0   # CDMA from string converted to an int; check if already in cdmaList
-currentCdmaInstance = 0     # CDMA instance number
-alreadyInCdmaList = False   # true if current CDMA is already in cdmaList, else false
-charIndex = 0
-for fileNameStr in existingFiles:
-    alreadyInCdmaList = False
-
-    # Determine index of hyphen "-" in the filename string 
-    for charIndex, char in enumerate(fileNameStr):
-        if char == '-': break
-
-    hyphenIndex = charIndex
-    currentCdmaFromFilename = int(fileNameStr[:hyphenIndex])
-        
-    # Determine index of period from ".txt". Indices of hyphen and period will
-    # be used to extract instance number from filename.
-    for charIndex, char in enumerate(fileNameStr):
-        if char == '.': break
-
-    dotIndex = charIndex
-    currentCdmaInstance = int(fileNameStr[(hyphenIndex + 1):dotIndex])
-
-    # Check if current CDMA is already represented in cdmaList
-    for cdmaListIndex in range(len(cdmaList)):
-        if cdmaList[cdmaListIndex][0] == currentCdmaFromFilename:
-            alreadyInCdmaList = True
-            break
-
-    # If current CDMA not in list, append CDMA and instance number to list.
-    # Else, if current CDMA is already in list, check if current instance
-    # number is larger than instance number in list. Replace if it is larger.
-    if not alreadyInCdmaList:
-        cdmaList.append([currentCdmaFromFilename, currentCdmaInstance])
-    else:
-        if currentCdmaInstance > cdmaList[cdmaListIndex][1]:
-            cdmaList[cdmaListIndex][1] = currentCdmaInstance
-
-# Import Tasker data
-with open(args["input-file"]) as fileName:
-    reader = csv.reader(fileName, delimiter=delim)
-    fileContents = list(reader)
-    
-# Function getCDMA(...) extracts the relevant data for a given CDMA value, then writes it to
-# a text file in a standardized format.
-def getCDMA(cdmaNum):
-    # Extract the relevant information and put into the list 'coordList'
-    # The cells in the CDMA column contain a string formatted as "CDMA:000" where "000" is the relevant number.
-    #   The code "int(fileContents[j][cdmaInd][5:])" extracts the number from the string (char 5 to end) in row
-    #   j of the list fileContents, and converts it to an int.
-    # The latitude and longitude are converted from str to float and appended to coordList if the CDMA matches.
-
-    coordList = list()   # Initialize coordList
-    for j in range(firstLine, len(fileContents)):
-        # try/except statement handles case where the CDMA is not an integer by continuing to the next iteration
-        try:
-            if int(fileContents[j][cdmaInd][5:]) == cdmaNum:
-                coordList.append([float(fileContents[j][latInd]), float(fileContents[j][lonInd])])
-        except:
-            pass
-
-    # Check if coordList empty.
-    if len(coordList) == 0:
-        print("Error: no matching CDMA entries found for CDMA {:d}.".format(cdmaNum))
-    else:
-        # If coordList not empty, determine (and increment) instance number.
-        # Then write coordList contents to file.
-        instanceNumToWrite = 0
-        for existingCdma in cdmaList:
-            if existingCdma[0] == cdmaNum:
-                instanceNumToWrite = existingCdma[1]
-                break
-        instanceNumToWrite += 1
-
-        outputPath = str(cdmaNum) + "-" + str(instanceNumToWrite) + ".txt"
-        with open(outputPath, "w") as output:
-            writer = csv.writer(output, lineterminator='\n', delimiter='\t')
-            for k in range(len(coordList)):
-                writer.writerow(coordList[k])
-        print("\n{:d} coordinates successfully written to {:s}".format(len(coordList),outputPath))
-
-# If --extract-all flag not used, run getCDMA(...) on selected CDMA. Else, find all unique CDMAs represented
-# in the file, and run getCDMA(...) on each.
-if not extractAll:
-    cdma = int(args["cdma_number"])
-    print("Extracting data for CDMA {:d}".format(cdma))
-    getCDMA(cdma)
-else:
-    uniqueCdmaList = list()
-    cdmaAlreadyInUniqueList = False
-    for j in range(firstLine, len(fileContents)):
-        cdmaAlreadyInUniqueList = False
-        # try/except statement handles case where CDMA column in the current line does not contain an int
-        try:
-            currentCdma = int(fileContents[j][cdmaInd][5:])
-            
-            # Check if currentCdma already exists in uniqueCdmaList
-            for existingUniqueCdma in uniqueCdmaList:
-                if currentCdma == existingUniqueCdma:
-                    cdmaAlreadyInUniqueList = True
-                    break
-            if not cdmaAlreadyInUniqueList:
-                uniqueCdmaList.append(currentCdma)
-        except:
-            pass
-
-    # Check if list empty, ie, no valid CDMA values found
-    if len(uniqueCdmaList) == 0:
-        print("Error: no valid CDMA entries found. Exiting.")
-        exit()
-    else:
-        print("The following CDMA values were found:")
-        for uniqueCdma in uniqueCdmaList: print(uniqueCdma)
-
-    # Run getCDMA(...) on each unique CDMA.
-    print("Extracting data for CDMA values.")
-    for uniqueCdma in uniqueCdmaList:
-        getCDMA(uniqueCdma)
+# Function addColumnOptions(...) adds the options that describe the layout of the Tasker data (delimiter,
+# column positions and first row) to a command line argument parser.
+def addColumnOptions(parser):
+    parser.add_argument("-d", "--delim", type=str, help="Delimiter. For the following special characters:\n" +
+        "sp (space)\ttab (tab)\tcr (carriage return)\tnl (newline). Default character is tab.")
+    parser.add_argument("-c", "--cdma-index", default="2",
+         help="The column index that contains the tower CDMA (first column = 0); default 2")
+    parser.add_argument("-a", "--latitude-index", default=3,
+        help="The column index that contains the latitude (first column = 0); default 3")
+    parser.add_argument("-o", "--longitude-index", default=4,
+        help="The column index that contains the longitude (first column = 0); default 4")
+    parser.add_argument("-f", "--first-line", default=0,
+        help="The row index where actual data begins (first row = 0); default 0")
+
+# Function getColumnOptions(...) returns (delim, columns, firstLine) from the options added by
+# addColumnOptions(...), where columns = (cdmaInd, latInd, lonInd) as used by cdmaExtract.py.
+def getColumnOptions(args):
+    delim = getDelimiter(args["delim"])
+    columns = (int(args["cdma_index"]), int(args["latitude_index"]), int(args["longitude_index"]))
+    return delim, columns, int(args["first_line"])
+
+# Function buildParser(...) configures the command line argument parser.
+def buildParser():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("input-file", help="File name of the desired file (required)")
+    parser.add_argument("-n", "--cdma-number", default=0, help="The CDMA of the desired cell tower; default 0")
+    addColumnOptions(parser)
+    parser.add_argument("-X", "--extract-all", action='store_true',
+        help="Extract all CDMAs from the file. Create a text file containing formatted coordinates for each" +
+            " CDMA found. If -X flag and -n flag are used simultaneously, -X takes priority.")
+    parser.add_argument("-S", "--stream", action='store_true',
+        help="Read the input file one row at a time instead of loading it into memory, and write the coordinates of" +
+            " each CDMA to its file in batches. Use for very large files.")
+    parser.add_argument("-b", "--batch-size", type=int, default=1000,
+        help="With --stream, the number of coordinates buffered per CDMA before they are written; default 1000")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+        help="Number of processes that parse the input file, each a range of its lines (0 = one per core). The" +
+            " output is the same as with a single process. Cannot be combined with --stream. Default 1")
+    parser.add_argument("-D", "--destination",
+        help="Choose the directory where the text file(s) will be placed (created if needed); default: the" +
+            " current directory")
+    parser.add_argument("-C", "--container",
+        help="Instead of one text file per CDMA, add the coordinates of each CDMA as a new instance to this single" +
+            " binary container file (.npz; created if needed). cell.py and cell2.py read one tower from it with" +
+            " --cdma. Cannot be combined with --stream.")
+    return parser
+
+# Function main(...) runs the script with the given command line arguments (sys.argv if None).
+def main(argv=None):
+    parser = buildParser()
+    args = vars(parser.parse_args(argv))
+    if args["container"] is not None and args["stream"]:
+        parser.error("--container cannot be combined with --stream")
+    if args["workers"] != 1 and args["stream"]:
+        parser.error("--workers cannot be combined with --stream")
+
+    # Set the delimiter and other parameters
+    delim, columns, firstLine = getColumnOptions(args)
+    extractAll = args["extract_all"]
+    streamInput = args["stream"]
+    batchSize = args["batch_size"]
+    containerPath = args["container"]
+    numWorkers = args["workers"] or None
+
+    # Get all unique CDMAs that are represented by existing formatted coordinate files in the output
+    # directory, with the largest instance number for each. These are kept in a manifest file in the
+    # directory, which is only rebuilt by listing the directory if it is missing; the entry of each CDMA is
+    # checked against its files before one is written (see loadInstances() and getOutputPath() in
+    # cdmaExtract.py).
+    destination = args["destination"]
+    if destination is not None:
+        os.makedirs(destination, exist_ok=True)
+    outputDir = destination if destination is not None else "."
+    # With --container no text files are written, so the manifest is neither read nor written.
+    instances = loadInstances(outputDir) if containerPath is None else None
+
+    # The manifest is updated once all files are written (or if the run fails part way). If a run is killed
+    # before, the files it wrote are found by the check in getOutputPath(), so no file is overwritten.
+    try:
+        # Import Tasker data. In streaming mode, rows are read one at a time as they are processed instead.
+        # With several workers, the file is parsed and grouped by CDMA in parallel, in ranges of lines.
+        if streamInput:
+            rows = readRows(args["input-file"], delim, firstLine)
+        elif numWorkers != 1:
+            parsedCoords = parallelGroupByCDMA(args["input-file"], delim, firstLine, columns, numWorkers)
+        else:
+            rows = readAllRows(args["input-file"], delim, firstLine)
+
+        # If --extract-all flag not used, extract the data for the selected CDMA. Else, group the coordinates of all
+        # CDMAs represented in the file in a single pass, and write the coordinates of each.
+        if not extractAll:
+            cdma = int(args["cdma_number"])
+            print("Extracting data for CDMA {:d}".format(cdma))
+            if streamInput:
+                writers = streamCDMA(rows, batchSize, instances, columns, cdma, destination)
+                if cdma in writers:
+                    writers[cdma].close()
+                else:
+                    print("Error: no matching CDMA entries found for CDMA {:d}.".format(cdma))
+            else:
+                if numWorkers != 1:
+                    coordList = parsedCoords.get(cdma, list())
+                else:
+                    coordList = extractCDMA(rows, cdma, columns)
+                if containerPath is not None:
+                    writeContainerCDMA(containerPath, {cdma: coordList})
+                else:
+                    writeCDMA(cdma, coordList, instances, destination)
+        elif streamInput:
+            # The CDMAs are only known once the whole file has been read, so they are listed after writing.
+            print("Extracting data for CDMA values.")
+            writers = streamCDMA(rows, batchSize, instances, columns, directory=destination)
+            if len(writers) == 0:
+                print("Error: no valid CDMA entries found. Exiting.")
+                return
+            print("The following CDMA values were found:")
+            for uniqueCdma in writers: print(uniqueCdma)
+            for writer in writers.values():
+                writer.close()
+        else:
+            coordsByCdma = parsedCoords if numWorkers != 1 else groupByCDMA(rows, columns)
+
+            # Check if empty, ie, no valid CDMA values found
+            if len(coordsByCdma) == 0:
+                print("Error: no valid CDMA entries found. Exiting.")
+                return
+            else:
+                print("The following CDMA values were found:")
+                for uniqueCdma in coordsByCdma: print(uniqueCdma)
+
+            # Write the coordinates of each unique CDMA.
+            print("Extracting data for CDMA values.")
+            if containerPath is not None:
+                writeContainerCDMA(containerPath, coordsByCdma)
+            else:
+                for uniqueCdma, coordList in coordsByCdma.items():
+                    writeCDMA(uniqueCdma, coordList, instances, destination)
+    finally:
+        if instances is not None:
+            writeManifest(outputDir, instances)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+# Tower location estimators behind cell.py and cell2.py, as functions that take an M x 2 array of
+# unique (lat, lon) coordinates. Used by the scripts themselves and by batchLocate.py.
+
+import numpy as np
+import metrics
+from circleFit import circumcircles, minEnclosingCircle, kasaFit, prattFit, ransacFit
+from coordIO import uniqueCoords, thinCoords
+from projection import toLocal, fromLocal, circleFromLocal
+from triangleSearch import largestTriangles, hullTriangles, sampledTriangles, parallelTriangles, \
+    firstCircleInRange, convexHull, perimeterBound, mergeTopK, selectCandidates
+
+# Estimation methods of cell.py (see locateCircle(...)).
+CIRCLE_METHODS = ["search", "mec", "kasa", "pratt", "ransac"]
+
+# Triangle search modes of cell2.py (see triangleCircles(...)).
+TRIANGLE_SEARCHES = ["exhaustive", "hull"]
+
+# Largest circle radius included in the average of the method of triangles/perimeters, in degrees, and
+# the corresponding default in meters (0.25 degrees of latitude) when working on the local plane.
+DEFAULT_MAX_RADIUS = 0.25
+DEFAULT_MAX_RADIUS_METERS = 27750.
+
+# Function prepareCoords(...) readies an M x 2 array of unique (lat, lon) coordinates for the estimators: if
+# metric is True, the points are projected once onto a local plane in meters around their centroid (see
+# projection.py), then, if thinSize is given, only the first point in each grid cell of that size (in the
+# units of the projection) is kept (see thinCoords(...) in coordIO.py). Outputs a 3-tuple containing
+# (coordArray, workArray, origin): the remaining points in (lat, lon), the same points in the units the
+# estimators work in, and the origin of the projection (None if metric is False).
+def prepareCoords(coordArray, metric=False, thinSize=None):
+    if metric:
+        workArray, origin = toLocal(coordArray)
+    else:
+        workArray, origin = coordArray, None
+    coordArray, workArray = thinCoords(coordArray, workArray, thinSize)
+    return coordArray, workArray, origin
+
+# Function toLatLon(...) converts an M x 2 array of points in the units of workArray (see prepareCoords(...))
+# back to (lat, lon). The points are returned as they are if origin is None.
+def toLatLon(points, origin):
+    if origin is None:
+        return np.asarray(points, dtype=float)
+    return fromLocal(points, origin)
+
+# Function centroidRadii(...) determines the "centroid" of the point distribution (centroid of latitude,
+# centroid of longitude), then the minimum radius of the circle, centered at the centroid, necessary to
+# capture the minPerc fraction of the points, and a max radius to preclude results that may be
+# unrealistically far away. Outputs a 5-tuple containing (latCentroid, lonCentroid, minRadius,
+# maxRadius, pointOrder), where pointOrder lists the indices of the points from nearest to farthest
+# from the centroid.
+def centroidRadii(coordArray, minPerc=0.9):
+    numPoints = len(coordArray)
+    latCentroid, lonCentroid = coordArray.mean(axis=0)
+
+    pointDist = np.hypot(coordArray[:,0] - latCentroid, coordArray[:,1] - lonCentroid)
+    pointOrder = np.argsort(pointDist, kind="stable")
+    pointDistList = pointDist[pointOrder]
+
+    minRadius = pointDistList[int(minPerc * numPoints - 1)]
+    maxRadius = 1.2 * pointDistList[-1]
+    return latCentroid, lonCentroid, minRadius, maxRadius, pointOrder
+
+# Function locateCircle(...) estimates the tower location with one of the methods of cell.py:
+#   search  the first circle through 3 points (in point order) whose radius r satisfies
+#           minRadius <= r < maxRadius
+#   mec     the minimum enclosing circle of the minPerc fraction of points nearest the centroid (at least 3)
+#   kasa    the Kasa algebraic least-squares circle fit to all points, if its radius is < maxRadius
+#   pratt   the Pratt algebraic least-squares circle fit to all points, if its radius is < maxRadius
+#   ransac  the Pratt fit to the inliers of the best of ransacIterations random circles
+# Outputs a 3-tuple containing (lat, lon, radius), or None if no circle was found.
+#
+# If metric is True, the points are first projected onto a local plane in meters (see projection.py);
+# ransacThreshold and the returned radius are then in meters.
+def locateCircle(coordArray, minPerc=0.9, method="search", ransacIterations=2000, ransacThreshold=None,
+        metric=False):
+    if metric:
+        localArray, origin = toLocal(coordArray)
+        return circleFromLocal(locateCircle(localArray, minPerc, method, ransacIterations, ransacThreshold),
+            origin)
+
+    if method == "mec":
+        latCentroid, lonCentroid, minRadius, maxRadius, pointOrder = centroidRadii(coordArray, minPerc)
+        # A circle around fewer than 3 points is not a tower estimate (one point gives radius 0).
+        numNearest = int(minPerc * len(coordArray))
+        if numNearest < 3:
+            return None
+        return minEnclosingCircle(coordArray[pointOrder[:numNearest]])
+    elif method in ["kasa", "pratt"]:
+        # The algebraic fits return a circle for any points, however degenerate (points along a straight road
+        # give a huge radius), so the fit is only accepted if its radius is below maxRadius, as for search.
+        if len(coordArray) < 3:
+            return None
+        lat0, lon0, radius = kasaFit(coordArray) if method == "kasa" else prattFit(coordArray)
+        if not np.isfinite(radius) or radius >= centroidRadii(coordArray, minPerc)[3]:
+            return None
+        return lat0, lon0, radius
+    elif method == "ransac":
+        lat0, lon0, radius, inliers = ransacFit(coordArray, ransacIterations, ransacThreshold)
+        if np.isnan(radius):
+            return None
+        return lat0, lon0, radius
+    elif method == "search":
+        latCentroid, lonCentroid, minRadius, maxRadius, pointOrder = centroidRadii(coordArray, minPerc)
+        firstHit = firstCircleInRange(coordArray, minRadius, maxRadius)
+        if firstHit is None:
+            return None
+        return float(firstHit[0]), float(firstHit[1]), float(firstHit[2])
+    raise ValueError("Unknown method '{:s}'".format(method))
+
+# Function circleEstimate(...) runs locateCircle(...) on workArray, the points prepared by prepareCoords(...),
+# and converts the center back to (lat, lon) with origin. Outputs a dict containing:
+#   circle              the circle (h, k, r) in the units of workArray, or None if no circle was found
+#   lat, lon, radius    its center in (lat, lon) and its radius (NaN if no circle was found)
+def circleEstimate(workArray, origin=None, minPerc=0.9, method="search", ransacIterations=2000,
+        ransacThreshold=None):
+    circle = locateCircle(workArray, minPerc, method, ransacIterations, ransacThreshold)
+    estimate = {"circle": circle, "lat": np.nan, "lon": np.nan, "radius": np.nan}
+    if circle is not None:
+        estimate["lat"], estimate["lon"] = [float(value) for value in toLatLon([circle[:2]], origin)[0]]
+        estimate["radius"] = float(circle[2])
+    return estimate
+
+# Function triangleCircles(...) finds the numTriangles sets of three points that form the triangles with
+# the largest perimeters (see triangleSearch.py), then computes the circle formed by each of them in one
+# batch. Outputs a 3-tuple containing (triIndices, triCircles, triCollinear): triIndices is a
+# numTriangles x 3 array of point indices in descending order of perimeter; triCircles is a
+# numTriangles x 3 array with column 0 = latitude (h), 1 = longitude (k), 2 = radius (r); triCollinear
+# flags the triangles that have no circumcircle (their row of triCircles is NaN).
+#
+# If timeBudget (in seconds) is given, search is ignored and random triples are evaluated until the time
+# runs out (see sampledTriangles(...)), so the triangles are the largest found rather than the largest.
+# progress is then called with the number of triples sampled so far.
+#
+# The exhaustive search runs in a pool of `workers` processes (all cores if 0) when workers is not 1 (see
+# parallelTriangles(...)); the result is the same.
+def triangleCircles(coordArray, numTriangles=10, search="exhaustive", selfCheck=False, progress=None,
+        timeBudget=None, workers=1):
+    if timeBudget is not None:
+        triPerims, triIndices, numSampled = sampledTriangles(coordArray, numTriangles, timeBudget,
+            progress=progress)
+    elif search == "hull":
+        triPerims, triIndices = hullTriangles(coordArray, numTriangles, selfCheck=selfCheck)
+    elif search == "exhaustive" and workers != 1:
+        triPerims, triIndices = parallelTriangles(coordArray, numTriangles, workers or None, progress=progress)
+    elif search == "exhaustive":
+        triPerims, triIndices = largestTriangles(coordArray, numTriangles, progress=progress)
+    else:
+        raise ValueError("Unknown search mode '{:s}'".format(search))
+
+    triPoints = coordArray[triIndices]
+    h, k, r, triCollinear = circumcircles(triPoints[:,0,:], triPoints[:,1,:], triPoints[:,2,:])
+    return triIndices, np.column_stack((h, k, r)), triCollinear
+
+# Function averageCircles(...) computes the average center and radius of the circles in triCircles,
+# leaving out collinear triangles and outliers/unrealistically large circles (r > maxRadius). Outputs a
+# 4-tuple containing (avgLat, avgLon, avgRad, used), where used flags the circles that were averaged.
+# The averages are NaN if no circle qualifies.
+def averageCircles(triCircles, triCollinear, maxRadius=DEFAULT_MAX_RADIUS):
+    used = ~triCollinear & (triCircles[:,2] <= maxRadius)
+    metrics.count("circlesRejectedMaxRadius", np.count_nonzero(~triCollinear & ~used))
+    if not used.any():
+        return np.nan, np.nan, np.nan, used
+    avgLat, avgLon, avgRad = triCircles[used].mean(axis=0)
+    return avgLat, avgLon, avgRad, used
+
+# Function triangleEstimate(...) runs the method of triangles/perimeters of cell2.py on workArray, the points
+# prepared by prepareCoords(...): the circles of the numTriangles largest-perimeter triangles (see
+# triangleCircles(...), which takes search, selfCheck, progress, timeBudget and workers) are averaged (see
+# averageCircles(...)), and the centers are converted back to (lat, lon) with origin. Outputs a dict
+# containing:
+#   triIndices, triCircles, triCollinear    as returned by triangleCircles(...)
+#   triUsed             the circles that were averaged, as returned by averageCircles(...)
+#   triCenters          the centers of triCircles in (lat, lon) (NaN for collinear triangles)
+#   avgCircle           the average circle (h, k, r) in the units of workArray (NaN if no circle qualified)
+#   lat, lon, radius    its center in (lat, lon) and its radius
+def triangleEstimate(workArray, origin=None, numTriangles=10, search="exhaustive", maxRadius=DEFAULT_MAX_RADIUS,
+        selfCheck=False, progress=None, timeBudget=None, workers=1):
+    triIndices, triCircles, triCollinear = triangleCircles(workArray, numTriangles, search, selfCheck, progress,
+        timeBudget, workers)
+    avgLat, avgLon, avgRad, triUsed = averageCircles(triCircles, triCollinear, maxRadius)
+    lat, lon = toLatLon([[avgLat, avgLon]], origin)[0]
+    return {"triIndices": triIndices, "triCircles": triCircles, "triCollinear": triCollinear, "triUsed": triUsed,
+        "triCenters": toLatLon(triCircles[:,:2], origin), "avgCircle": np.array([avgLat, avgLon, avgRad]),
+        "lat": float(lat), "lon": float(lon), "radius": float(avgRad)}
+
+# Function locateTriangles(...) estimates the tower location with the method of triangles/perimeters
+# of cell2.py: the average center of the circles formed by the numTriangles largest-perimeter triangles.
+# Outputs a 3-tuple containing (lat, lon, radius), or None if no circle qualified for the average.
+#
+# If metric is True, the points are first projected onto a local plane in meters (see projection.py);
+# maxRadius and the returned radius are then in meters. With timeBudget, the triangles are sampled for
+# that many seconds (see triangleCircles(...)).
+def locateTriangles(coordArray, numTriangles=10, search="exhaustive", maxRadius=DEFAULT_MAX_RADIUS, metric=False,
+        timeBudget=None):
+    coordArray, workArray, origin = prepareCoords(coordArray, metric)
+    estimate = triangleEstimate(workArray, origin, numTriangles, search, maxRadius, timeBudget=timeBudget)
+    if not estimate["triUsed"].any():
+        return None
+    return estimate["lat"], estimate["lon"], estimate["radius"]
+
+# Class IncrementalTriangleLocator keeps the method of triangles/perimeters estimate of cell2.py up to date
+# as new hand-off points arrive, without searching all sets of three points again. It is seeded with an
+# M x 2 array of coordinates; addPoints(...) then updates the set of the numTriangles largest-perimeter
+# triangles by only evaluating triangles that have a new point as a vertex, and recomputes the average
+# circle. The estimate is always the same as that of locateTriangles(...) on all points seen so far (with
+# duplicates removed, keeping the first occurrence).
+class IncrementalTriangleLocator:
+    def __init__(self, coordArray, numTriangles=10, maxRadius=DEFAULT_MAX_RADIUS):
+        self.numTriangles = numTriangles
+        self.maxRadius = maxRadius
+        self.points = uniqueCoords(np.array(coordArray, dtype=float).reshape(-1, 2))
+        self.seen = set(map(tuple, self.points.tolist()))
+        self.hullPoints = self.points[convexHull(self.points)]
+        self.perims, self.tris = hullTriangles(self.points, numTriangles)
+        self.updateCircles()
+
+    # Recompute the circles of the current triangles and their average.
+    def updateCircles(self):
+        triPoints = self.points[self.tris]
+        h, k, r, self.triCollinear = circumcircles(triPoints[:,0,:], triPoints[:,1,:], triPoints[:,2,:])
+        self.triCircles = np.column_stack((h, k, r))
+        self.avgLat, self.avgLon, self.avgRad, self.triUsed = averageCircles(self.triCircles,
+            self.triCollinear, self.maxRadius)
+
+    # Add one point, with index n = len(self.points), and merge the triangles (a, b, n) that can enter the
+    # top set. Perimeter is a convex function of each vertex, so for fixed a and n it is largest with b on
+    # the convex hull of the points. This bounds the perimeter of every triangle (a, b, n), first for the
+    # new point as a whole and then for each a; only pairs of points a, b that pass are evaluated.
+    def addPoint(self, point):
+        n = len(self.points)
+        self.points = np.vstack((self.points, [point]))
+        hullPoints = np.vstack((self.hullPoints, [point]))
+        self.hullPoints = hullPoints[convexHull(hullPoints)]
+        if n < 2:
+            return
+
+        oldPoints = self.points[:n]
+        # Distances and perimeters are computed as in largestTriangles(), so that equal perimeters are
+        # rounded alike and ties are broken the same way.
+        toNew = point - oldPoints
+        distToNew = np.sqrt(toNew[:,0] * toNew[:,0] + toNew[:,1] * toNew[:,1])
+        if len(self.perims) == self.numTriangles:
+            threshold = self.perims[-1]
+            # A new triangle (a, b, n) may come before an existing one of equal perimeter in the order of
+            # mergeTopK() (if a is smaller), so ties are kept and mergeTopK() breaks them. The bounds are
+            # scaled up slightly so that round-off cannot prune a qualifying triangle.
+            if perimeterBound(np.array([point]), self.hullPoints)[0] * (1. + 1e-12) < threshold:
+                return
+            hullToNew = np.hypot(self.hullPoints[:,0] - point[0], self.hullPoints[:,1] - point[1])
+            diff = oldPoints[:,np.newaxis,:] - self.hullPoints[np.newaxis,:,:]
+            toHull = np.hypot(diff[:,:,0], diff[:,:,1])
+            bound = distToNew + (toHull + hullToNew[np.newaxis,:]).max(axis=1)
+            candidates = np.nonzero(bound * (1. + 1e-12) >= threshold)[0]
+        else:
+            threshold = None
+            candidates = np.arange(n)
+        if len(candidates) < 2:
+            return
+
+        aa, bb = np.triu_indices(len(candidates), 1)
+        a = candidates[aa]
+        b = candidates[bb]
+        sides = self.points[b] - self.points[a]
+        perims = (np.sqrt(sides[:,0] * sides[:,0] + sides[:,1] * sides[:,1]) + distToNew[a]) + distToNew[b]
+        keep = selectCandidates(perims, self.numTriangles, threshold, strict=False)
+        if keep.any():
+            tris = np.column_stack((a[keep], b[keep], np.full(np.count_nonzero(keep), n, dtype=np.intp)))
+            self.perims, self.tris = mergeTopK(self.perims, self.tris, perims[keep], tris, self.numTriangles)
+
+    # Function addPoints(...) adds an N x 2 array of new points (duplicates of points already seen are
+    # ignored) and updates the estimate. Costs at most O(M^2) per new point, and usually far less, since
+    # most points cannot form a triangle larger than the current numTriangles-th perimeter.
+    def addPoints(self, newPoints):
+        for point in np.asarray(newPoints, dtype=float).reshape(-1, 2).tolist():
+            if tuple(point) in self.seen:
+                continue
+            self.seen.add(tuple(point))
+            self.addPoint(point)
+        self.updateCircles()
+
+    # Function estimate(...) outputs a 3-tuple containing the current (lat, lon, radius), or None if no
+    # circle qualified for the average.
+    def estimate(self):
+        if not self.triUsed.any():
+            return None
+        return self.avgLat, self.avgLon, self.avgRad
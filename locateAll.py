@@ -0,0 +1,133 @@
+############################################################################################################
+# Name: locateAll.py
+#
+# Description: Locate every cell tower in a Tasker log in one step. The log is read once, its rows are
+#   grouped by CDMA (with the column options of formatCoords.py), and the coordinates of each CDMA are
+#   passed as an array straight to the estimator of cell.py (--estimator circle) or cell2.py (--estimator
+#   triangles), without writing them to text files and parsing them back. The results are written as one
+#   tab-delimited table with the columns of batchLocate.py:
+#       cdma, instance, lat, lon, radius, points, seconds
+#   in the order in which each CDMA first appears in the log. instance is empty unless the coordinates are
+#   also written to files with --write-files (as formatCoords.py -X does, in --destination), in which case
+#   it is the instance number of the file written. Towers are localized in parallel with -j.
+#
+#   Example:
+#   >> python locateAll.py tasker.txt -M -O towers.txt
+#
+############################################################################################################
+
+import argparse
+import os
+import sys
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+
+from batchLocate import COLUMNS, addEstimatorOptions, locateRow, formatRow
+from cdmaExtract import readRows, groupByCDMA, loadInstances, writeManifest, writeCDMA
+from coordIO import uniqueCoords, describeThinning
+from formatCoords import addColumnOptions, getColumnOptions
+
+# IN THE COMMAND LINE, RUN THIS SCRIPT WITH THE OPTION -h TO PRINT HELP MESSAGE. EXAMPLE:
+# >> python locateAll.py -h
+
+# Function locateCoords(...) removes the duplicates from the list of [lat, lon] coordinates of one CDMA, runs
+# the chosen estimator on them and returns a dict with the COLUMNS of its results row (see locateFile(...)
+# in batchLocate.py). May run in a worker process, so errors are reported in the row rather than raised.
+def locateCoords(cdmaNum, instance, coordList, options):
+    startTime = time.time()
+    row = {"cdma": str(cdmaNum), "instance": "" if instance is None else str(instance),
+        "lat": None, "lon": None, "radius": None, "points": 0, "unthinned": 0, "error": None}
+
+    try:
+        if len(coordList) == 0:
+            raise ValueError("no valid coordinates")
+        coordArray = uniqueCoords(np.array(coordList, dtype=float))
+        locateRow(coordArray, options, row)
+    except Exception as error:
+        row["error"] = "{:s}: {:s}".format(type(error).__name__, str(error))
+
+    row["seconds"] = time.time() - startTime
+    return row
+
+# Function locateGroups(...) localizes each CDMA of coordsByCdma (see groupByCDMA(...) in cdmaExtract.py)
+# and returns the results rows in the same order. instances maps each CDMA to the instance reported in its
+# row (None for none). With workers = 1 the towers are localized in this process, else in a pool of
+# `workers` processes (all cores if None).
+def locateGroups(coordsByCdma, instances, options, workers=None):
+    cdmas = list(coordsByCdma)
+    jobs = [cdmas, [instances.get(cdmaNum) for cdmaNum in cdmas], [coordsByCdma[cdmaNum] for cdmaNum in cdmas],
+        [options] * len(cdmas)]
+    if workers == 1:
+        return list(map(locateCoords, *jobs))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(locateCoords, *jobs))
+
+# Function buildParser(...) configures the command line argument parser.
+def buildParser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input-file", help="File name of the Tasker log (required)")
+    addColumnOptions(parser)
+    addEstimatorOptions(parser)
+    parser.add_argument("-W", "--write-files", action="store_true",
+        help="Also write the coordinates of each CDMA to a text file, as formatCoords.py -X does.")
+    parser.add_argument("-D", "--destination",
+        help="With --write-files, the directory where the text files are placed (created if needed); default: the" +
+            " current directory")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+        help="Number of worker processes; 1 localizes in this process. Default: the number of cores")
+    parser.add_argument("-O", "--output", help="File to write the results table to. Default: standard output")
+    return parser
+
+# Function main(...) runs the script with the given command line arguments (sys.argv if None).
+def main(argv=None):
+    args = vars(buildParser().parse_args(argv))
+    delim, columns, firstLine = getColumnOptions(args)
+
+    startTime = time.time()
+    coordsByCdma = groupByCDMA(readRows(args["input-file"], delim, firstLine), columns)
+    if len(coordsByCdma) == 0:
+        print("Error: no valid CDMA entries found. Exiting.")
+        return
+    numRows = sum(len(coordList) for coordList in coordsByCdma.values())
+    sys.stderr.write("{:d} coordinates of {:d} CDMAs read in {:.3f} seconds.\n".format(numRows,
+        len(coordsByCdma), time.time() - startTime))
+
+    # The messages of writeCDMA() go to stderr, so that standard output only holds the table.
+    written = dict()
+    if args["write_files"]:
+        destination = args["destination"]
+        if destination is not None:
+            os.makedirs(destination, exist_ok=True)
+        outputDir = destination if destination is not None else "."
+        instances = loadInstances(outputDir)
+        try:
+            with redirect_stdout(sys.stderr):
+                for cdmaNum, coordList in coordsByCdma.items():
+                    writeCDMA(cdmaNum, coordList, instances, destination)
+                    if len(coordList) > 0:
+                        written[cdmaNum] = instances[cdmaNum]
+        finally:
+            writeManifest(outputDir, instances)
+
+    rows = locateGroups(coordsByCdma, written, args, args["workers"])
+
+    output = open(args["output"], "w") if args["output"] else sys.stdout
+    output.write("\t".join(COLUMNS) + "\n")
+    for row in rows:
+        output.write(formatRow(row) + "\n")
+    if output is not sys.stdout:
+        output.close()
+
+    for row in rows:
+        if row["error"] is not None:
+            sys.stderr.write("Error in CDMA {:s}: {:s}\n".format(row["cdma"], row["error"]))
+    if args["thin"] is not None:
+        numUnthinned = sum(row["unthinned"] for row in rows)
+        numPoints = sum(row["points"] for row in rows)
+        sys.stderr.write(describeThinning(numPoints, numUnthinned) + "\n")
+    sys.stderr.write("{:d} towers localized in {:.3f} seconds.\n".format(len(rows), time.time() - startTime))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+############################################################################################################
+# Name: locateService.py
+#
+# Description: Local localization service. Keeps a Python interpreter, numpy and a pool of worker
+#   processes running, so that each tower estimate only costs the estimate itself instead of interpreter
+#   startup and imports. Listens for HTTP requests on a local TCP port (--port) or a Unix socket
+#   (--socket), and runs the estimates in the worker pool so that concurrent requests do not block each
+#   other. Each request is a POST to /locate with a JSON object containing either
+#       "points"    a list of [lat, lon] pairs (duplicates are removed, keeping the first), or
+#       "file"      the name of a "[CDMA]-[instance].txt" file written by formatCoords.py in the --root
+#                   directory (parsed coordinates are cached next to it, see coordIO.py); other names and
+#                   paths are refused
+#   and optionally any of the options of batchLocate.py, by their long names with underscores, eg,
+#       {"file": "385-2.txt", "estimator": "circle", "method": "pratt", "metric": true}
+#   The response is a JSON object with the keys cdma, instance (for files), lat, lon, radius, points and
+#   seconds, as in the table of batchLocate.py; lat, lon and radius are null if no estimate was found.
+#   Errors are returned with the key "error" and HTTP status 400; for files, only the type of a read error
+#   is reported, not its message, which may quote the file. GET /health returns {"status": "ok"}.
+#   The service answers anyone who can reach it, so keep --host on a loopback address.
+#
+#   Example:
+#   >> python locateService.py --port 8750 &
+#   >> curl -s -d '{"file": "385-2.txt"}' http://127.0.0.1:8750/locate
+#
+############################################################################################################
+
+import argparse
+import asyncio
+import ipaddress
+import json
+import math
+import os
+import signal
+import socket
+import stat
+import sys
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from batchLocate import locateFile, locateRow
+from cdmaExtract import FILE_PATTERN
+from coordIO import uniqueCoords
+from localize import CIRCLE_METHODS, TRIANGLE_SEARCHES
+
+# IN THE COMMAND LINE, RUN THIS SCRIPT WITH THE OPTION -h TO PRINT HELP MESSAGE. EXAMPLE:
+# >> python locateService.py -h
+
+# Options of a request that are not given, as for batchLocate.py.
+DEFAULT_OPTIONS = {"estimator": "triangles", "method": "search", "percent": 0.9, "search": "hull",
+    "num_triangles": 10, "max_radius": None, "metric": False, "thin": None, "time_budget": None,
+    "no_cache": False, "clear_cache": False}
+
+# Largest request body accepted, in bytes.
+MAX_BODY_SIZE = 64 * 1024 * 1024
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    413: "Payload Too Large"}
+
+# Function getOptions(...) checks the options of a request and merges them with DEFAULT_OPTIONS. Raises
+# ValueError for unknown options or values.
+def getOptions(request):
+    options = dict(DEFAULT_OPTIONS)
+    for key, value in request.items():
+        if key in ["points", "file"]:
+            continue
+        if key not in options:
+            raise ValueError("Unknown option '{:s}'".format(key))
+        options[key] = value
+    if options["estimator"] not in ["circle", "triangles"]:
+        raise ValueError("Unknown estimator '{:s}'".format(str(options["estimator"])))
+    if options["method"] not in CIRCLE_METHODS:
+        raise ValueError("Unknown method '{:s}'".format(str(options["method"])))
+    if options["search"] not in TRIANGLE_SEARCHES:
+        raise ValueError("Unknown search mode '{:s}'".format(str(options["search"])))
+    return options
+
+# Function resolveFile(...) returns the path of the coordinate file fileName of a request in the directory
+# root. Raises ValueError unless fileName is the bare name of a "[CDMA]-[instance].txt" file (no directory)
+# that exists in root and does not link outside it.
+def resolveFile(root, fileName):
+    if not isinstance(fileName, str) or not FILE_PATTERN.match(fileName):
+        raise ValueError("'file' must be the name of a [CDMA]-[instance].txt file in the service directory")
+    filePath = os.path.join(root, fileName)
+    if not os.path.isfile(filePath) or os.path.dirname(os.path.realpath(filePath)) != root:
+        raise ValueError("File '{:s}' not found".format(fileName))
+    return filePath
+
+# Function isLoopback(...) tells whether host is a loopback address (or "localhost").
+def isLoopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+# Function locatePoints(...) runs in a worker process and localizes a list of [lat, lon] points, returning
+# a results row like locateFile(...) in batchLocate.py.
+def locatePoints(points, options):
+    startTime = time.time()
+    row = {"cdma": "", "instance": "", "lat": None, "lon": None, "radius": None, "points": 0, "error": None}
+    try:
+        coordArray = np.array(points, dtype=float).reshape(-1, 2)
+        locateRow(uniqueCoords(coordArray), options, row)
+    except Exception as error:
+        row["error"] = "{:s}: {:s}".format(type(error).__name__, str(error))
+    row["seconds"] = time.time() - startTime
+    return row
+
+# Function warmUp(...) runs in each worker process when the pool starts, so that the first requests do
+# not pay for starting the workers.
+def warmUp():
+    return os.getpid()
+
+# Function initWorker(...) runs when a worker process starts. Ctrl-C is handled by the server, which shuts
+# the pool down, so the workers ignore it.
+def initWorker():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+# Class LocateService handles the HTTP requests of one server. Estimates run in a pool of `workers`
+# processes (all cores if None), and files are only read from the directory root.
+class LocateService:
+    def __init__(self, workers=None, root="."):
+        self.root = os.path.realpath(root)
+        self.numWorkers = workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(max_workers=self.numWorkers, initializer=initWorker)
+        self.numRequests = 0
+
+    # Start every worker process by giving each one a trivial job.
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(self.executor, warmUp) for k in range(self.numWorkers)])
+
+    def close(self):
+        self.executor.shutdown()
+
+    # Function locate(...) runs the estimate of one decoded request in the worker pool and returns
+    # (status, response).
+    async def locate(self, request):
+        if not isinstance(request, dict) or ("points" in request) == ("file" in request):
+            return 400, {"error": "The request must be a JSON object with either 'points' or 'file'."}
+        try:
+            options = getOptions(request)
+            if "file" in request:
+                filePath = resolveFile(self.root, request["file"])
+        except ValueError as error:
+            return 400, {"error": str(error)}
+
+        loop = asyncio.get_running_loop()
+        if "file" in request:
+            row = await loop.run_in_executor(self.executor, locateFile, filePath, options)
+            # The message of a read error may quote the contents of the file; only its type is returned.
+            if row["error"] is not None:
+                row["error"] = "Could not locate the tower from the file ({:s})".format(
+                    row["error"].partition(":")[0])
+        else:
+            row = await loop.run_in_executor(self.executor, locatePoints, request["points"], options)
+        row.pop("unthinned", None)
+        # NaN and infinity are not valid JSON; a value that is not finite is reported as no estimate (null).
+        for key in ["lat", "lon", "radius"]:
+            if row[key] is not None and not math.isfinite(row[key]):
+                row[key] = None
+        if row["error"] is not None:
+            return 400, row
+        row.pop("error")
+        return 200, row
+
+    # Function route(...) returns (status, response) for a request method, path and body.
+    async def route(self, method, path, body):
+        if path == "/health":
+            return 200, {"status": "ok", "requests": self.numRequests}
+        if path != "/locate":
+            return 404, {"error": "Unknown path '{:s}'".format(path)}
+        if method != "POST":
+            return 405, {"error": "Use POST for /locate."}
+        try:
+            request = json.loads(body.decode("utf-8"))
+        except ValueError as error:
+            return 400, {"error": "Invalid JSON: {:s}".format(str(error))}
+        return await self.locate(request)
+
+    # Function handle(...) serves the requests of one connection, keeping it open between requests unless
+    # the client asks to close it.
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                requestLine = await reader.readline()
+                if not requestLine.strip():
+                    break
+                parts = requestLine.decode("latin-1").split()
+                if len(parts) < 2:
+                    break
+                method, path = parts[0].upper(), parts[1].split("?")[0]
+
+                headers = dict()
+                while True:
+                    line = await reader.readline()
+                    if line in [b"\r\n", b"\n", b""]:
+                        break
+                    name, sep, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_SIZE:
+                    status, response = 413, {"error": "Request body too large."}
+                    body = None
+                else:
+                    body = await reader.readexactly(length)
+                    self.numRequests += 1
+                    status, response = await self.route(method, path, body)
+
+                payload = json.dumps(response, allow_nan=False).encode("utf-8")
+                keepAlive = body is not None and headers.get("connection", "").lower() != "close" and \
+                    not parts[-1].upper().endswith("/1.0")
+                writer.write("HTTP/1.1 {:d} {:s}\r\nContent-Type: application/json\r\nContent-Length: {:d}\r\n"
+                    "Connection: {:s}\r\n\r\n".format(status, HTTP_REASONS[status], len(payload),
+                    "keep-alive" if keepAlive else "close").encode("latin-1") + payload)
+                await writer.drain()
+                if not keepAlive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+# Function removeStaleSocket(...) removes the socket file at socketPath if it was left behind by a server
+# that was killed (a connection to it is refused), so that it can be bound again. Raises OSError if the path
+# is not a socket, or if a server is still listening on it.
+def removeStaleSocket(socketPath):
+    try:
+        mode = os.stat(socketPath).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise OSError("{:s} exists and is not a socket".format(socketPath))
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socketPath)
+    except (ConnectionRefusedError, FileNotFoundError):
+        os.remove(socketPath)
+        return
+    finally:
+        probe.close()
+    raise OSError("A server is already listening on {:s}".format(socketPath))
+
+# Function serve(...) starts the service on a Unix socket (if socketPath is given) or on host:port and
+# serves until interrupted (Ctrl-C or SIGTERM). Coordinate files are read from the directory root.
+async def serve(host, port, socketPath, workers, root="."):
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in [signal.SIGINT, signal.SIGTERM]:
+        loop.add_signal_handler(signum, stop.set)
+
+    if socketPath is not None:
+        removeStaleSocket(socketPath)
+    service = LocateService(workers, root)
+    boundSocket = False
+    try:
+        await service.start()
+        if socketPath is not None:
+            server = await asyncio.start_unix_server(service.handle, path=socketPath)
+            boundSocket = True
+            print("Listening on {:s}".format(socketPath), flush=True)
+        else:
+            server = await asyncio.start_server(service.handle, host, port)
+            print("Listening on http://{:s}:{:d}".format(host, port), flush=True)
+        async with server:
+            await stop.wait()
+    finally:
+        service.close()
+        # Only the socket this server created is removed.
+        if boundSocket and os.path.exists(socketPath):
+            os.remove(socketPath)
+
+# Function main(...) runs the script with the given command line arguments (sys.argv if None).
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on. Default 127.0.0.1")
+    parser.add_argument("--port", type=int, default=8750, help="TCP port to listen on. Default 8750")
+    parser.add_argument("--socket", default=None, help="Listen on this Unix socket instead of a TCP port.")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+        help="Number of worker processes. Default: the number of cores")
+    parser.add_argument("--root", default=".",
+        help="Directory of the coordinate files that requests may name. Default: the current directory")
+    args = vars(parser.parse_args(argv))
+
+    if not os.path.isdir(args["root"]):
+        print("Error: {:s} is not a directory".format(args["root"]))
+        return 1
+    if args["socket"] is None and not isLoopback(args["host"]):
+        sys.stderr.write(("Warning: {:s} is not a loopback address; anyone who can reach it can locate the files" +
+            " in {:s}.\n").format(args["host"], os.path.realpath(args["root"])))
+    try:
+        asyncio.run(serve(args["host"], args["port"], args["socket"], args["workers"], args["root"]))
+    except OSError as error:
+        print("Error: {:s}".format(str(error)))
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,41 @@
+# Named stage timers and counters for finding where a run spends its time. Collection is off by default;
+# until enable() is called, count() and stage() return immediately, and they are only called once per
+# stage or block of work (never per point or per triple), so the overhead is negligible either way.
+
+import json
+import time
+from contextlib import contextmanager
+
+enabled = False
+counters = dict()   # counter name -> count
+stages = dict()     # stage name -> total seconds
+
+# Function enable(...) turns collection on (or off) and clears anything collected so far.
+def enable(on=True):
+    global enabled
+    enabled = on
+    counters.clear()
+    stages.clear()
+
+# Function count(...) adds amount to the named counter.
+def count(name, amount=1):
+    if enabled:
+        counters[name] = counters.get(name, 0) + int(amount)
+
+# Function stage(...) is a context manager that adds the time spent in its block to the named stage:
+#   with metrics.stage("search"):
+#       ...
+@contextmanager
+def stage(name):
+    if not enabled:
+        yield
+        return
+    startTime = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages[name] = stages.get(name, 0.) + time.perf_counter() - startTime
+
+# Function report(...) returns everything collected so far as a JSON string.
+def report():
+    return json.dumps({"stages": stages, "counters": counters}, indent=2, sort_keys=True)
@@ -0,0 +1,46 @@
+# Plotting helpers shared by cell.py and cell2.py. matplotlib is only imported when a plot is requested,
+# and with a non-interactive backend when the plot is written to a file, so that runs without a display
+# (or without a plot) neither hang nor pay for the import.
+
+import numpy as np
+
+# Plot modes of cell.py and cell2.py: show the plot in a window, write it to a file, or skip it.
+PLOT_MODES = ["show", "file", "none"]
+
+# Number of points used to construct (the circumference of) circles.
+CIRCLE_RESOLUTION = 100
+
+# Function circleOutlines(...) returns the outlines of a batch of circles as one array, computed by
+# broadcasting. circles is an M x 3 array with column 0 = h, 1 = k, 2 = r; the result is an
+# M x resolution x 2 array whose [m,:,0] and [m,:,1] are the h and k coordinates of the points on the
+# circumference of circle m.
+def circleOutlines(circles, resolution=CIRCLE_RESOLUTION):
+    circles = np.atleast_2d(np.asarray(circles, dtype=float))
+    theta = np.linspace(0, 2 * np.pi, resolution)
+    h = circles[:,0,np.newaxis] + circles[:,2,np.newaxis] * np.cos(theta)
+    k = circles[:,1,np.newaxis] + circles[:,2,np.newaxis] * np.sin(theta)
+    return np.stack((h, k), axis=2)
+
+# Function getPyplot(...) imports and returns matplotlib.pyplot for the given plot mode ("show" or "file").
+# In file mode the non-interactive Agg backend is selected first.
+def getPyplot(mode):
+    import matplotlib
+    if mode == "file":
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+# Function lineCollection(...) returns a matplotlib LineCollection of the given lines (a sequence of
+# K x 2 arrays of x, y points, or one array of shape M x K x 2), so that they are drawn in one call.
+def lineCollection(lines, **kwargs):
+    from matplotlib.collections import LineCollection
+    return LineCollection(lines, **kwargs)
+
+# Function finishPlot(...) shows the figure, or writes it to plotFile and closes it, depending on mode.
+def finishPlot(plt, fig, mode, plotFile):
+    if mode == "file":
+        fig.savefig(plotFile)
+        plt.close(fig)
+        print("Plot written to {:s}".format(plotFile))
+    else:
+        plt.show()
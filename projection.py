@@ -0,0 +1,86 @@
+# Projection of (lat, lon) coordinates onto a local flat plane in meters, so that distances, radii and
+# thresholds are in meters rather than in degrees (a degree of longitude is shorter than a degree of
+# latitude everywhere but the equator, so circles on the ground are ellipses in lat/lon).
+#
+# The plane is the east-north-up (ENU) tangent plane of the WGS84 ellipsoid at an origin (by default the
+# centroid of the points). Points are converted once, all geometry is done on the flat arrays, and only
+# the results are converted back. Local arrays keep the column order of coordArray: column 0 is north
+# (along latitude) and column 1 is east (along longitude), both in meters.
+
+import numpy as np
+
+# WGS84 ellipsoid: semi-major axis (m), flattening, and first eccentricity squared.
+WGS84_A = 6378137.0
+WGS84_F = 1. / 298.257223563
+WGS84_E2 = WGS84_F * (2. - WGS84_F)
+
+# Function geodeticToEcef(...) converts arrays of latitude and longitude (degrees) and height above the
+# ellipsoid (m) to Earth-centered, Earth-fixed (x, y, z) coordinates in meters.
+def geodeticToEcef(lat, lon, height=0.):
+    phi = np.radians(lat)
+    lam = np.radians(lon)
+    N = WGS84_A / np.sqrt(1. - WGS84_E2 * np.sin(phi)**2)
+    x = (N + height) * np.cos(phi) * np.cos(lam)
+    y = (N + height) * np.cos(phi) * np.sin(lam)
+    z = (N * (1. - WGS84_E2) + height) * np.sin(phi)
+    return x, y, z
+
+# Function ecefToGeodetic(...) converts ECEF (x, y, z) coordinates in meters to (lat, lon, height) with
+# Bowring's formula, which is accurate to well under a millimeter near the surface of the Earth.
+def ecefToGeodetic(x, y, z):
+    b = WGS84_A * (1. - WGS84_F)
+    ep2 = (WGS84_A**2 - b**2) / b**2
+    p = np.hypot(x, y)
+    theta = np.arctan2(z * WGS84_A, p * b)
+    phi = np.arctan2(z + ep2 * b * np.sin(theta)**3, p - WGS84_E2 * WGS84_A * np.cos(theta)**3)
+    lam = np.arctan2(y, x)
+    N = WGS84_A / np.sqrt(1. - WGS84_E2 * np.sin(phi)**2)
+    height = p / np.cos(phi) - N
+    return np.degrees(phi), np.degrees(lam), height
+
+# Function enuBasis(...) returns the unit east, north and up vectors (in ECEF) at an origin (lat, lon).
+def enuBasis(origin):
+    phi = np.radians(origin[0])
+    lam = np.radians(origin[1])
+    east = np.array([-np.sin(lam), np.cos(lam), 0.])
+    north = np.array([-np.sin(phi) * np.cos(lam), -np.sin(phi) * np.sin(lam), np.cos(phi)])
+    up = np.array([np.cos(phi) * np.cos(lam), np.cos(phi) * np.sin(lam), np.sin(phi)])
+    return east, north, up
+
+# Function toLocal(...) projects an M x 2 array of (lat, lon) coordinates onto the tangent plane at origin
+# (by default the centroid of the points). Outputs a 2-tuple containing (localArray, origin), where
+# localArray is an M x 2 array of (north, east) coordinates in meters.
+def toLocal(coordArray, origin=None):
+    coordArray = np.asarray(coordArray, dtype=float)
+    if origin is None:
+        origin = tuple(coordArray.mean(axis=0))
+    east, north, up = enuBasis(origin)
+    x0, y0, z0 = geodeticToEcef(origin[0], origin[1])
+    x, y, z = geodeticToEcef(coordArray[:,0], coordArray[:,1])
+    offset = np.column_stack((x - x0, y - y0, z - z0))
+    return np.column_stack((offset.dot(north), offset.dot(east))), origin
+
+# Function fromLocal(...) converts an M x 2 array of (north, east) coordinates in meters on the tangent plane
+# at origin back to (lat, lon), ie, it finds the points on the ellipsoid that toLocal(...) projects onto
+# them. The up coordinate of such a point is not known in advance; it starts at 0 and is corrected by the
+# height of the resulting point above the ellipsoid, which converges in a few iterations.
+def fromLocal(localArray, origin, iterations=3):
+    localArray = np.atleast_2d(np.asarray(localArray, dtype=float))
+    east, north, up = enuBasis(origin)
+    x0, y0, z0 = geodeticToEcef(origin[0], origin[1])
+    base = np.array([x0, y0, z0]) + np.outer(localArray[:,0], north) + np.outer(localArray[:,1], east)
+
+    upOffset = np.zeros(len(localArray))
+    for iteration in range(iterations):
+        point = base + np.outer(upOffset, up)
+        lat, lon, height = ecefToGeodetic(point[:,0], point[:,1], point[:,2])
+        upOffset -= height
+    return np.column_stack((lat, lon))
+
+# Function circleFromLocal(...) converts a circle (h, k, r) found on the tangent plane at origin to a circle
+# with its center in (lat, lon) and its radius still in meters. None is passed through.
+def circleFromLocal(circle, origin):
+    if circle is None:
+        return None
+    lat, lon = fromLocal([[circle[0], circle[1]]], origin)[0]
+    return float(lat), float(lon), float(circle[2])
@@ -0,0 +1,379 @@
+# Searches over sets of three points. cell2.py (method of triangles/perimeters) uses these to pick
+# the triangles with the largest perimeters, whose circumcircles are averaged into the tower
+# estimate; cell.py uses them to find the first circle whose radius falls in a given range.
+
+import os
+import time
+import numpy as np
+import metrics
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+from circleFit import circumcircles
+
+# Default number of triples evaluated per block. Each block is a slab of the (j, k) plane for a fixed
+# first point i, so memory use is roughly 8 * blockSize bytes per array.
+DEFAULT_BLOCK_SIZE = 2000000
+
+# Smaller blocks for first-hit scans, which usually stop early.
+DEFAULT_SCAN_BLOCK_SIZE = 50000
+
+# Number of random triples drawn per batch by sampledTriangles(); the time budget is checked after
+# each batch.
+DEFAULT_SAMPLE_BLOCK_SIZE = 50000
+
+# Bias of sampledTriangles() toward points far from the centroid: a point is drawn by its rank r in
+# descending order of distance, with r = floor(numPoints * u**SAMPLE_BIAS) for u uniform in [0, 1).
+SAMPLE_BIAS = 3.
+
+# Function distanceMatrix(...) computes the matrix of pairwise Euclidean distances between the rows
+# of an M x 2 array of points. dist[i,j] is the length of the vector points[j] - points[i].
+def distanceMatrix(points):
+    diff = points[np.newaxis,:,:] - points[:,np.newaxis,:]
+    return np.sqrt(diff[:,:,0] * diff[:,:,0] + diff[:,:,1] * diff[:,:,1])
+
+# Function tripleBlocks(...) is a generator that enumerates every triple of row indices (i, j, k),
+# with i < j < k < numPoints, in the same order as the triple nested loop
+#   for i in range(numPoints - 2): for j in range(i+1, numPoints - 1): for k in range(j+1, numPoints)
+# but in blocks of about blockSize triples. Each block shares a single first index i and is yielded
+# as (i, j, k), where j and k are equal-length integer arrays. With iStart and iStop, only the triples
+# whose first index i is in range(iStart, iStop) are enumerated.
+def tripleBlocks(numPoints, blockSize=DEFAULT_BLOCK_SIZE, iStart=0, iStop=None):
+    if iStop is None:
+        iStop = numPoints - 2
+    for i in range(iStart, min(iStop, numPoints - 2)):
+        numK = numPoints - (i + 1)
+        rowsPerBlock = max(1, blockSize // max(numK, 1))
+
+        for jStart in range(i + 1, numPoints - 1, rowsPerBlock):
+            jStop = min(jStart + rowsPerBlock, numPoints - 1)
+            jIdx = np.arange(jStart, jStop)
+            kIdx = np.arange(jStart + 1, numPoints)
+            jj, kk = np.nonzero(kIdx[np.newaxis,:] > jIdx[:,np.newaxis])
+            yield i, jIdx[jj], kIdx[kk]
+
+# Function mergeTopK(...) merges a block of candidate triangles into the current best set and
+# keeps the numTriangles largest perimeters. Ties are broken in favor of the triangle that comes
+# first in (i, j, k) enumeration order, which is the order used by the original triple loop.
+def mergeTopK(bestPerims, bestTris, perims, tris, numTriangles):
+    perims = np.concatenate((bestPerims, perims))
+    tris = np.concatenate((bestTris, tris))
+    order = np.lexsort((tris[:,2], tris[:,1], tris[:,0], -perims))[:numTriangles]
+    return perims[order], tris[order]
+
+# Function selectCandidates(...) returns a boolean mask of the perimeters in a block that could
+# still enter a top set of size numTriangles whose smallest perimeter is currentMin (None if the
+# set is not full yet). Every value tied with the numTriangles-th largest is kept. With strict, a
+# perimeter equal to currentMin is dropped, which is only correct if every triangle of the block comes
+# after those of the set in the order of mergeTopK(...) (ties are broken by the indices).
+def selectCandidates(perims, numTriangles, currentMin=None, strict=True):
+    if currentMin is not None and strict:
+        # A later triangle only displaces an existing one if its perimeter is strictly larger.
+        keep = perims > currentMin
+    elif currentMin is not None:
+        keep = perims >= currentMin
+    else:
+        keep = np.ones(len(perims), dtype=bool)
+
+    if np.count_nonzero(keep) > numTriangles:
+        kthIndex = len(perims) - numTriangles
+        kth = np.partition(perims, kthIndex)[kthIndex]
+        keep &= perims >= kth
+    return keep
+
+# Function rangeTriangles(...) evaluates the perimeters of the triples whose first index i is in
+# range(iStart, iStop), given the pairwise distance matrix dist of the points, and keeps the top
+# numTriangles (see largestTriangles()). Returns a tuple (perims, tris, numEvaluated). If progress is
+# given, it is called as progress(numEvaluated) after each block.
+def rangeTriangles(dist, numTriangles, iStart, iStop, blockSize=DEFAULT_BLOCK_SIZE, progress=None):
+    bestPerims = np.zeros(0)
+    bestTris = np.zeros((0, 3), dtype=np.intp)
+    numEvaluated = 0
+
+    for i, j, k in tripleBlocks(len(dist), blockSize, iStart, iStop):
+        # perim = |Pj - Pi| + |Pk - Pi| + |Pk - Pj|
+        perims = (dist[i, j] + dist[i, k]) + dist[j, k]
+
+        currentMin = bestPerims[-1] if len(bestPerims) == numTriangles else None
+        keep = selectCandidates(perims, numTriangles, currentMin)
+        if keep.any():
+            tris = np.column_stack((np.full(np.count_nonzero(keep), i, dtype=np.intp), j[keep], k[keep]))
+            bestPerims, bestTris = mergeTopK(bestPerims, bestTris, perims[keep], tris, numTriangles)
+
+        numEvaluated += len(perims)
+        if progress is not None:
+            progress(numEvaluated)
+
+    return bestPerims, bestTris, numEvaluated
+
+# Function largestTriangles(...) finds the numTriangles triangles with the largest perimeters that
+# can be formed from the rows of coordArray. The pairwise distance matrix is computed once, then
+# perimeters are evaluated in blocks of (i, j, k) triples, with i < j < k, and the running top set
+# is maintained by partial selection (np.partition) rather than by sorting every block.
+#
+# Returns a tuple (perims, tris): perims is a 1-D array of perimeters in descending order and tris is
+# a numTriangles x 3 integer array of the row indices (i, j, k) of the corresponding points.
+#
+# If progress is given, it is called as progress(numEvaluated, numCombinations) after each block.
+def largestTriangles(coordArray, numTriangles, blockSize=DEFAULT_BLOCK_SIZE, progress=None):
+    numPoints = len(coordArray)
+    numCombinations = numPoints * (numPoints - 1) * (numPoints - 2) // 6
+    dist = distanceMatrix(np.asarray(coordArray, dtype=float))
+
+    if progress is not None:
+        blockProgress = lambda numEvaluated: progress(numEvaluated, numCombinations)
+    else:
+        blockProgress = None
+    bestPerims, bestTris, numEvaluated = rangeTriangles(dist, numTriangles, 0, numPoints - 2, blockSize,
+        blockProgress)
+
+    metrics.count("triplesEvaluated", numEvaluated)
+    return bestPerims, bestTris
+
+# Distance matrix shared with the worker processes of parallelTriangles(), attached by attachSharedDist().
+sharedDist = None
+sharedMemory = None
+
+# Function attachSharedDist(...) is the initializer of the worker processes of parallelTriangles(). It
+# attaches the shared memory block holding the distance matrix and keeps it open for the worker's lifetime.
+def attachSharedDist(name, shape):
+    global sharedDist, sharedMemory
+    sharedMemory = shared_memory.SharedMemory(name=name)
+    sharedDist = np.ndarray(shape, dtype=np.float64, buffer=sharedMemory.buf)
+
+# Function searchChunk(...) runs in a worker process of parallelTriangles() and returns the result of
+# rangeTriangles(...) on the shared distance matrix for one chunk of first indices.
+def searchChunk(iStart, iStop, numTriangles, blockSize):
+    return rangeTriangles(sharedDist, numTriangles, iStart, iStop, blockSize)
+
+# Function chunkBounds(...) splits the first indices i of the triples of numPoints points into about
+# numChunks ranges with equal numbers of triples. The number of triples with first index i is
+# (n-1-i)(n-2-i)/2, so early ranges are much shorter than late ones. Returns the boundaries, starting
+# at 0 and ending at numPoints - 2.
+def chunkBounds(numPoints, numChunks):
+    if numPoints < 3:
+        return np.array([0, max(numPoints - 2, 0)])
+    remainingAfter = np.arange(numPoints - 2, 0, -1)
+    work = remainingAfter * (remainingAfter + 1) // 2
+    cumWork = np.cumsum(work)
+    targets = cumWork[-1] * np.arange(1, numChunks) / float(numChunks)
+    inner = np.searchsorted(cumWork, targets) + 1
+    return np.unique(np.concatenate(([0], inner, [numPoints - 2])))
+
+# Function parallelTriangles(...) returns the same result as largestTriangles(), with the search spread
+# over a pool of `workers` processes (all cores if None). The distance matrix is computed once and placed
+# in shared memory, the first indices i are split into load-balanced chunks (several per worker), each
+# worker keeps the top numTriangles of its chunks, and the per-chunk results are merged. Since mergeTopK()
+# orders by perimeter and then (i, j, k), the merged set is identical to that of the serial search.
+#
+# If progress is given, it is called as progress(numEvaluated, numCombinations) as chunks complete.
+def parallelTriangles(coordArray, numTriangles, workers=None, blockSize=DEFAULT_BLOCK_SIZE, progress=None,
+        chunksPerWorker=4):
+    numPoints = len(coordArray)
+    numCombinations = numPoints * (numPoints - 1) * (numPoints - 2) // 6
+    if workers is None:
+        workers = os.cpu_count() or 1
+    dist = distanceMatrix(np.asarray(coordArray, dtype=float))
+    bounds = chunkBounds(numPoints, workers * chunksPerWorker)
+
+    bestPerims = np.zeros(0)
+    bestTris = np.zeros((0, 3), dtype=np.intp)
+    numEvaluated = 0
+    block = shared_memory.SharedMemory(create=True, size=max(dist.nbytes, 1))
+    try:
+        np.ndarray(dist.shape, dtype=np.float64, buffer=block.buf)[:] = dist
+        with ProcessPoolExecutor(max_workers=workers, initializer=attachSharedDist,
+                initargs=(block.name, dist.shape)) as executor:
+            futures = [executor.submit(searchChunk, iStart, iStop, numTriangles, blockSize)
+                for iStart, iStop in zip(bounds[:-1], bounds[1:])]
+            for future in as_completed(futures):
+                perims, tris, chunkEvaluated = future.result()
+                bestPerims, bestTris = mergeTopK(bestPerims, bestTris, perims, tris, numTriangles)
+                numEvaluated += chunkEvaluated
+                if progress is not None:
+                    progress(numEvaluated, numCombinations)
+    finally:
+        block.close()
+        block.unlink()
+
+    metrics.count("triplesEvaluated", numEvaluated)
+    return bestPerims, bestTris
+
+# Function convexHull(...) returns the indices of the vertices of the convex hull of an M x 2 array
+# of points, in counterclockwise order, using Andrew's monotone chain algorithm. Points that lie on
+# an edge of the hull without being a vertex are not included.
+def convexHull(points):
+    points = np.asarray(points, dtype=float)
+    order = np.lexsort((points[:,1], points[:,0]))
+    if len(order) < 3:
+        return order
+
+    def cross(o, a, b):
+        return ((points[a,0] - points[o,0]) * (points[b,1] - points[o,1]) -
+            (points[a,1] - points[o,1]) * (points[b,0] - points[o,0]))
+
+    lower = list()
+    for idx in order:
+        while len(lower) >= 2 and cross(lower[-2], lower[-1], idx) <= 0:
+            lower.pop()
+        lower.append(idx)
+
+    upper = list()
+    for idx in order[::-1]:
+        while len(upper) >= 2 and cross(upper[-2], upper[-1], idx) <= 0:
+            upper.pop()
+        upper.append(idx)
+
+    return np.array(lower[:-1] + upper[:-1], dtype=np.intp)
+
+# Function perimeterBound(...) returns, for each row of points, an upper bound on the perimeter of
+# any triangle that has that point as a vertex and its other two vertices in the set whose convex
+# hull vertices are hullPoints. Perimeter is a convex function of each vertex, so over the set it is
+# maximized with the other two vertices on the hull; the bound is therefore
+#   max over hull vertices q, r of |P - q| + |P - r| + |q - r|.
+def perimeterBound(points, hullPoints, blockSize=DEFAULT_BLOCK_SIZE):
+    hullDist = distanceMatrix(hullPoints)
+    numHull = len(hullPoints)
+    rowsPerBlock = max(1, blockSize // max(numHull * numHull, 1))
+
+    bound = np.zeros(len(points))
+    for start in range(0, len(points), rowsPerBlock):
+        block = points[start:start + rowsPerBlock]
+        diff = block[:,np.newaxis,:] - hullPoints[np.newaxis,:,:]
+        toHull = np.sqrt(diff[:,:,0] * diff[:,:,0] + diff[:,:,1] * diff[:,:,1])
+        perims = toHull[:,:,np.newaxis] + toHull[:,np.newaxis,:] + hullDist[np.newaxis,:,:]
+        bound[start:start + rowsPerBlock] = perims.reshape(len(block), -1).max(axis=1)
+    return bound
+
+# Function hullTriangles(...) returns the same result as largestTriangles(), but only enumerates
+# triples over the points that can still be part of a top-numTriangles triangle. The candidate set
+# starts as the convex hull; further hull layers of the remaining points are peeled off and added
+# until every point outside the candidate set is pruned, ie, its perimeterBound() is strictly less
+# than the numTriangles-th largest perimeter found among the candidates. The result is therefore
+# exact, and for the ring-shaped point sets produced by hand-offs the candidate set is typically a
+# few dozen points.
+#
+# If selfCheck is True, the result is compared against the exhaustive largestTriangles() search
+# and a RuntimeError is raised if they differ.
+def hullTriangles(coordArray, numTriangles, blockSize=DEFAULT_BLOCK_SIZE, selfCheck=False):
+    points = np.asarray(coordArray, dtype=float)
+    hullPoints = points[convexHull(points)]
+
+    remaining = np.arange(len(points))
+    candidates = np.zeros(0, dtype=np.intp)
+    while True:
+        # Peel the next hull layer off the remaining points and add it to the candidate set.
+        if len(remaining) <= 3:
+            layer = remaining
+        else:
+            layer = remaining[convexHull(points[remaining])]
+        candidates = np.sort(np.concatenate((candidates, layer)))
+        remaining = np.setdiff1d(remaining, layer, assume_unique=True)
+
+        numCandidates = len(candidates)
+        if len(remaining) > 0 and numCandidates * (numCandidates - 1) * (numCandidates - 2) // 6 < numTriangles:
+            continue
+
+        # Candidates are kept in ascending index order, so the tie-break on (i, j, k) order inside
+        # largestTriangles() matches the exhaustive search.
+        perims, tris = largestTriangles(points[candidates], numTriangles, blockSize)
+        if len(remaining) == 0:
+            break
+
+        # Drop every remaining point that cannot beat the current numTriangles-th perimeter. The
+        # threshold only grows as candidates are added, so dropped points never need revisiting.
+        # The bound is scaled up slightly so that round-off cannot drop a qualifying point.
+        bound = perimeterBound(points[remaining], hullPoints, blockSize)
+        remaining = remaining[bound * (1. + 1e-12) >= perims[-1]]
+        if len(remaining) == 0:
+            break
+
+    tris = candidates[tris]
+    metrics.count("hullCandidates", len(candidates))
+
+    if selfCheck:
+        checkPerims, checkTris = largestTriangles(points, numTriangles, blockSize)
+        if not np.array_equal(tris, checkTris):
+            raise RuntimeError("Hull-pruned triangle search does not match the exhaustive search.")
+
+    return perims, tris
+
+# Function sampledTriangles(...) is an anytime approximation of largestTriangles() for point sets too
+# large to search exhaustively. Triples are drawn at random in batches of blockSize until timeBudget
+# seconds have passed (at least one batch is always drawn), and the running top set is kept as in
+# largestTriangles(). The vertices are drawn with a strong bias toward the points farthest from the
+# centroid (see SAMPLE_BIAS), since the largest triangles are formed by the outermost points, but every
+# point can be drawn. Triples with a repeated point are discarded, and a triple drawn more than once only
+# enters the top set once. If all triples fit in one batch, the exact largestTriangles() search is done
+# instead.
+#
+# Returns a tuple (perims, tris, numSampled), where perims and tris are as for largestTriangles() and
+# numSampled is the number of triples evaluated (counting repeats). If progress is given, it is called as
+# progress(numSampled, numCombinations) after each batch.
+def sampledTriangles(coordArray, numTriangles, timeBudget, blockSize=DEFAULT_SAMPLE_BLOCK_SIZE, seed=0,
+        progress=None):
+    deadline = time.perf_counter() + timeBudget
+    points = np.asarray(coordArray, dtype=float)
+    numPoints = len(points)
+    numCombinations = numPoints * (numPoints - 1) * (numPoints - 2) // 6
+    if numCombinations <= blockSize:
+        perims, tris = largestTriangles(points, numTriangles, blockSize, progress)
+        return perims, tris, numCombinations
+
+    centered = points - points.mean(axis=0)
+    byDistance = np.argsort(-(centered[:,0] * centered[:,0] + centered[:,1] * centered[:,1]), kind="stable")
+
+    rng = np.random.RandomState(seed)
+    bestPerims = np.zeros(0)
+    bestTris = np.zeros((0, 3), dtype=np.intp)
+    numSampled = 0
+    while True:
+        draws = byDistance[(numPoints * rng.uniform(size=(blockSize, 3))**SAMPLE_BIAS).astype(np.intp)]
+        draws.sort(axis=1)
+        tris = draws[(draws[:,0] < draws[:,1]) & (draws[:,1] < draws[:,2])]
+
+        # perim = |Pj - Pi| + |Pk - Pi| + |Pk - Pj|
+        side1 = points[tris[:,1]] - points[tris[:,0]]
+        side2 = points[tris[:,2]] - points[tris[:,0]]
+        side3 = points[tris[:,2]] - points[tris[:,1]]
+        perims = (np.sqrt(side1[:,0] * side1[:,0] + side1[:,1] * side1[:,1]) +
+            np.sqrt(side2[:,0] * side2[:,0] + side2[:,1] * side2[:,1])) + \
+            np.sqrt(side3[:,0] * side3[:,0] + side3[:,1] * side3[:,1])
+
+        currentMin = bestPerims[-1] if len(bestPerims) == numTriangles else None
+        keep = selectCandidates(perims, numTriangles, currentMin)
+        if keep.any():
+            # Drop repeats of the same triple, within the batch and against the current top set.
+            allPerims = np.concatenate((bestPerims, perims[keep]))
+            allTris = np.concatenate((bestTris, tris[keep]))
+            keys = (allTris[:,0].astype(np.int64) * numPoints + allTris[:,1]) * numPoints + allTris[:,2]
+            unique = np.unique(keys, return_index=True)[1]
+            bestPerims, bestTris = mergeTopK(bestPerims[:0], bestTris[:0], allPerims[unique], allTris[unique],
+                numTriangles)
+
+        numSampled += len(tris)
+        if progress is not None:
+            progress(numSampled, numCombinations)
+        if time.perf_counter() >= deadline:
+            break
+
+    metrics.count("triplesEvaluated", numSampled)
+    return bestPerims, bestTris, numSampled
+
+# Function firstCircleInRange(...) scans the triples of coordArray in (i, j, k) order and returns the
+# first one whose circumcircle has a radius r with minRadius <= r < maxRadius, as the tuple
+# (h, k, r, (i, j, k)). Collinear triples are skipped. Returns None if no triple qualifies. This is
+# the search performed by cell.py; circles are solved a block of triples at a time.
+def firstCircleInRange(coordArray, minRadius, maxRadius, blockSize=DEFAULT_SCAN_BLOCK_SIZE):
+    points = np.asarray(coordArray, dtype=float)
+    for i, j, k in tripleBlocks(len(points), blockSize):
+        h, kCenter, r, collinear = circumcircles(points[i], points[j], points[k])
+        inRange = ~collinear & (r >= minRadius) & (r < maxRadius)
+        if inRange.any():
+            hit = np.argmax(inRange)
+            metrics.count("triplesEvaluated", hit + 1)
+            metrics.count("circlesRejectedRadius", np.count_nonzero(~collinear[:hit]))
+            return h[hit], kCenter[hit], r[hit], (i, j[hit], k[hit])
+        metrics.count("triplesEvaluated", len(r))
+        metrics.count("circlesRejectedRadius", np.count_nonzero(~collinear))
+    return None